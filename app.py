@@ -1,19 +1,59 @@
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify
-from PIL import Image
-import google.generativeai as genai
-import numpy as np
+load_dotenv()  # before the model imports, which read their settings from the environment
+
+from flask import Flask, render_template, request, jsonify, Response, g
+import contextvars
+import json
 import logging
 import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from werkzeug.utils import secure_filename
 from models.ensemble import (
     ImageClassificationEnsemble, 
     ObjectDetectionEnsemble, 
     SentimentEnsemble,
-    TextExtractionEnsemble
+    TextExtractionEnsemble,
+    CombinedAnalysisEnsemble
 )
-from datetime import datetime
+from models.gemini_client import GeminiUnavailableError, create_model, get_client
+from models.ids import new_id
 from models.data_collector import DataCollector
+from models.singleflight import SingleFlight
+from models.phash import NearDuplicateIndex, fingerprint
+from models.metrics import (
+    ANALYSES,
+    REQUEST_MEMORY_BYTES,
+    REQUEST_SECONDS,
+    account_memory,
+    finish_memory_tracking,
+    memory_tracker,
+    query_type_context,
+    render_metrics,
+    reset_query_type,
+    reserve_memory,
+    set_query_type,
+    stage,
+    start_memory_tracking
+)
+from models.cache import ResultCache, image_cache_key
+from models.archives import is_archive, iter_uploaded_images
+from models.jobs import JobManager
+from models.ingestion import UploadStore, UploadTooLargeError, read_upload
+from models.preprocessing import ImagePreprocessor, ImageTooLargeError, DEFAULT_TARGET_SIZES, encode_image
+from models.tiling import TEXT_TILED_MAX_SIDE, TEXT_TILING_MODE
+from models.frames import (
+    FRAME_ANALYSIS_CONCURRENCY,
+    VIDEO_EXTENSIONS,
+    aggregate_results,
+    is_multiframe,
+    iter_frames,
+    select_keyframes
+)
+from models.collection_queue import BackgroundCollector
 
 # Configure logging
 logging.basicConfig(
@@ -22,23 +62,64 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-load_dotenv()
 app = Flask(__name__)
 
 class MLModels:
+    # Each model is built on first use, so a worker only pays for the query types it serves
+    FACTORIES = {
+        'gemini_model': create_model,
+        'image_classifier': ImageClassificationEnsemble,
+        'object_detector': ObjectDetectionEnsemble,
+        'sentiment_analyzer': SentimentEnsemble,
+        'text_extractor': TextExtractionEnsemble,
+        'combined_analyzer': CombinedAnalysisEnsemble,
+        'data_collector': DataCollector
+    }
+
+    # Models needed to serve each query type, used by warm_up()
+    QUERY_TYPE_MODELS = {
+        'general': ['gemini_model'],
+        'classification': ['image_classifier'],
+        'object_detection': ['object_detector'],
+        'sentiment': ['sentiment_analyzer'],
+        'text_extraction': ['text_extractor'],
+        'all': ['combined_analyzer']
+    }
+
     def __init__(self):
-        try:
-            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-            self.gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-            self.image_classifier = self._init_with_retry(ImageClassificationEnsemble)
-            self.object_detector = self._init_with_retry(ObjectDetectionEnsemble)
-            self.sentiment_analyzer = self._init_with_retry(SentimentEnsemble)
-            self.text_extractor = self._init_with_retry(TextExtractionEnsemble)
-            self.data_collector = DataCollector()
-            logger.info("ML models initialized successfully")
-        except Exception as e:
-            logger.error(f"Error initializing ML models: {str(e)}")
-            raise
+        self._instances = {}
+        self._locks = {name: threading.Lock() for name in self.FACTORIES}
+
+    def __getattr__(self, name):
+        # Only called for attributes not set on the instance, i.e. the lazy models
+        if name not in self.FACTORIES:
+            raise AttributeError(name)
+
+        with self._locks[name]:
+            if name not in self._instances:
+                try:
+                    start = time.perf_counter()
+                    self._instances[name] = self._init_with_retry(self.FACTORIES[name])
+                    logger.info(f"Initialized {name} in {time.perf_counter() - start:.2f}s")
+                except Exception as e:
+                    logger.error(f"Error initializing {name}: {str(e)}")
+                    raise
+        return self._instances[name]
+
+    def warm_up(self, query_types=None):
+        # Build the models (and any local backends) for the given query types ahead of traffic
+        for query_type in query_types or self.QUERY_TYPE_MODELS:
+            for name in self.QUERY_TYPE_MODELS[query_type]:
+                model = getattr(self, name)
+                local_model = getattr(model, 'local_model', None)
+                if local_model is not None and getattr(model, 'backend', 'gemini') != 'gemini':
+                    local_model.get()
+        logger.info("ML models warmed up")
+
+    def batcher_stats(self):
+        # Micro-batching stats for the ensembles built so far
+        return {name: model.local_batcher.stats() for name, model in list(self._instances.items())
+                if hasattr(model, 'local_batcher')}
 
     def get_gemini_response(self, prompt, image):
         try:
@@ -48,7 +129,7 @@ class MLModels:
                 prompt = "Please analyze the image."  # Default prompt if none is provided
 
             # Attempt to generate content using the Gemini API
-            response = self.gemini_model.generate_content([prompt, image])
+            response = self.gemini_model.generate_content([prompt, encode_image(image)])
 
             # Check if response is valid
             if response and hasattr(response, 'text'):
@@ -61,6 +142,20 @@ class MLModels:
             logger.error(f"Gemini model error: {str(e)}")
             raise
 
+    def stream_gemini_response(self, prompt, image):
+        try:
+            if not prompt:
+                logger.warning("Prompt is empty, generating content with image only.")
+                prompt = "Please analyze the image."
+
+            # Yield text chunks as Gemini produces them
+            for chunk in self.gemini_model.generate_content([prompt, encode_image(image)], stream=True):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Gemini streaming error: {str(e)}")
+            raise
+
     def _init_with_retry(self, model_class, max_retries=3):
         for attempt in range(max_retries):
             try:
@@ -70,19 +165,244 @@ class MLModels:
                     raise
                 logger.warning(f"Retry {attempt + 1} for {model_class.__name__}: {str(e)}")
 
+    @property
+    def initialized(self):
+        return sorted(self._instances)
+
 # Add these configurations
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# Only /analyze decodes video frames; every other endpoint takes still images
+ANALYZE_EXTENSIONS = ALLOWED_EXTENSIONS | VIDEO_EXTENSIONS
+QUERY_TYPES = {'general', 'classification', 'object_detection', 'sentiment', 'text_extraction', 'all'}
+
+# Comma separated query types (or 'all') to build at startup instead of on first request
+WARMUP_QUERY_TYPES = os.getenv('WARMUP_QUERY_TYPES', '')
+WARMUP_BLOCKING = os.getenv('WARMUP_BLOCKING', 'false').lower() in ('1', 'true', 'yes')
+
+# Result cache configuration (set RESULT_CACHE_DIR to keep hits across restarts)
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1024'))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '86400'))
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR')
+
+# Upper bound on concurrent ensemble calls for a single /analyze/batch request
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '8'))
+
+# Background analysis jobs; finished jobs are kept for polling until JOB_TTL expires
+JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', '64'))
+JOB_TTL = int(os.getenv('JOB_TTL', '3600'))
+
+# Upload persistence: 'sync' writes before analysis, 'async' writes in the
+# background and 'none' keeps uploads in memory only
+UPLOAD_PERSIST_MODE = os.getenv('UPLOAD_PERSIST_MODE', 'sync')
+
+# Size limits: a whole request body (Flask answers 413 past it) and a single image, video or
+# archive member, checked while it is read
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(256 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(64 * 1024 * 1024)))
+
+# Near-duplicate reuse: a re-encoded or resized copy of an analysed image gets the earlier
+# result. Only for query types whose answer does not depend on exact pixels or size.
+NEAR_DUPLICATE_QUERY_TYPES = {
+    query_type for query_type in os.getenv('NEAR_DUPLICATE_QUERY_TYPES', 'classification,sentiment').split(',')
+    if query_type
+}
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '5'))
+NEAR_DUPLICATE_INDEX_SIZE = int(os.getenv('NEAR_DUPLICATE_INDEX_SIZE', '10000'))
+
+# Training data collection runs on a background writer thread
+COLLECT_TRAINING_DATA = os.getenv('COLLECT_TRAINING_DATA', 'false').lower() in ('1', 'true', 'yes')
+COLLECTED_QUERY_TYPES = {'classification', 'object_detection', 'sentiment', 'text_extraction'}
+COLLECTOR_QUEUE_SIZE = int(os.getenv('COLLECTOR_QUEUE_SIZE', '1000'))
+COLLECTOR_BATCH_SIZE = int(os.getenv('COLLECTOR_BATCH_SIZE', '32'))
+COLLECTOR_DROP_POLICY = os.getenv('COLLECTOR_DROP_POLICY', 'drop_newest')
+
+# Longest side sent to the models per query type, e.g. IMAGE_MAX_SIDE_TEXT_EXTRACTION=4096
+IMAGE_TARGET_SIZES = {
+    query_type: int(os.getenv(f'IMAGE_MAX_SIDE_{query_type.upper()}', default))
+    for query_type, default in dict(
+        DEFAULT_TARGET_SIZES,
+        # Tiled extraction reads pages at a resolution a single call would have to discard
+        text_extraction=TEXT_TILED_MAX_SIDE if TEXT_TILING_MODE != 'off' else DEFAULT_TARGET_SIZES['text_extraction']
+    ).items()
+}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+upload_store = UploadStore(UPLOAD_FOLDER, persist_mode=UPLOAD_PERSIST_MODE)
 
-def allowed_file(filename):
+def allowed_file(filename, extensions=ALLOWED_EXTENSIONS):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+           filename.rsplit('.', 1)[1].lower() in extensions
 
 ml_models = MLModels()  # Create an instance of MLModels
 
+def warm_up_models():
+    if not WARMUP_QUERY_TYPES:
+        return
+    query_types = None if WARMUP_QUERY_TYPES == 'all' else [
+        query_type.strip() for query_type in WARMUP_QUERY_TYPES.split(',') if query_type.strip()
+    ]
+    if WARMUP_BLOCKING:
+        ml_models.warm_up(query_types)
+    else:
+        threading.Thread(target=ml_models.warm_up, args=(query_types,), name='warm-up', daemon=True).start()
+
+warm_up_models()
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_SIZE,
+    ttl_seconds=RESULT_CACHE_TTL,
+    disk_path=RESULT_CACHE_DIR
+)
+in_flight = SingleFlight()
+near_duplicates = {
+    query_type: NearDuplicateIndex(NEAR_DUPLICATE_MAX_DISTANCE, NEAR_DUPLICATE_INDEX_SIZE)
+    for query_type in NEAR_DUPLICATE_QUERY_TYPES
+}
+preprocessor = ImagePreprocessor(IMAGE_TARGET_SIZES)
+training_collector = BackgroundCollector(
+    ml_models.data_collector,
+    max_queue_size=COLLECTOR_QUEUE_SIZE,
+    batch_size=COLLECTOR_BATCH_SIZE,
+    drop_policy=COLLECTOR_DROP_POLICY
+) if COLLECT_TRAINING_DATA else None
+job_manager = JobManager(max_workers=JOB_MAX_WORKERS, ttl_seconds=JOB_TTL)
+
+def ingest_upload(image_file, query_type='general', allow_multiframe=False):
+    # Decode straight from memory; the upload store decides whether and when it hits disk.
+    # With allow_multiframe, videos and animated GIFs are not decoded here and image is None.
+    filename = secure_filename(image_file.filename)
+    unique_filename = f"{new_id()}_{filename}"
+
+    with stage('upload_read'):
+        data = read_upload(image_file, max_bytes=MAX_UPLOAD_BYTES)
+    account_memory(len(data))
+    if allow_multiframe and is_multiframe(filename, data):
+        image = None
+    else:
+        image = preprocessor.load(data, query_type)
+    with stage('upload_save'):
+        stored_filename = upload_store.persist(unique_filename, data)
+    return image, stored_filename, data
+
+def collect_training_sample(query_type, analysis, data, stored_filename, filename, user_feedback=None):
+    # Hand the sample to the background writer; never blocks the request on disk I/O.
+    # A persisted upload is hard linked into the blob store instead of written again, so
+    # queued records only hold the bytes while the upload may not be on disk yet.
+    if training_collector is None or query_type not in COLLECTED_QUERY_TYPES:
+        return False
+
+    on_disk = stored_filename is not None and UPLOAD_PERSIST_MODE == 'sync'
+    return training_collector.submit({
+        'image_path': os.path.join(UPLOAD_FOLDER, stored_filename) if stored_filename else None,
+        'image_bytes': None if on_disk else data,
+        'image_filename': stored_filename or filename,
+        'analysis_results': analysis,
+        'query_type': query_type,
+        'user_feedback': user_feedback
+    })
+
+def upload_url(stored_filename):
+    return f'/static/uploads/{stored_filename}' if stored_filename else None
+
+def run_analysis(query_type, image, text_input=''):
+    analysis = {}
+
+    if query_type == 'general':
+        prompt = text_input if text_input else "Analyze this image in detail."
+        analysis['gemini_response'] = ml_models.get_gemini_response(prompt, image)
+
+    elif query_type == 'classification':
+        classifications = ml_models.image_classifier.predict(image)
+        analysis['classification'] = {'predictions': classifications}
+
+    elif query_type == 'object_detection':
+        analysis['objects'] = ml_models.object_detector.detect(image)
+
+    elif query_type == 'sentiment':
+        sentiment = ml_models.sentiment_analyzer.analyze(image, text_input if text_input else None)
+        analysis['sentiment'] = sentiment['ensemble_prediction']
+
+    elif query_type == 'text_extraction':
+        analysis['extracted_text'] = ml_models.text_extractor.extract(image)
+
+    elif query_type == 'all':
+        # One Gemini call for every section, returned under the per-type keys
+        combined = ml_models.combined_analyzer.analyze(image)
+        analysis['gemini_response'] = combined['description']
+        analysis['classification'] = {'predictions': combined['classification']}
+        analysis['objects'] = combined['objects']
+        analysis['sentiment'] = combined['sentiment']['ensemble_prediction']
+        analysis['extracted_text'] = combined['text']
+
+    else:
+        raise ValueError(f"Invalid query type: {query_type}")
+
+    return analysis
+
+def cached_analysis(query_type, image, text_input=''):
+    # Only general and sentiment requests feed the user's text into the prompt
+    prompt = text_input if query_type in ('general', 'sentiment') else ''
+    cache_key = image_cache_key(image, query_type, prompt)
+
+    analysis = result_cache.get(cache_key)
+    if analysis is not None:
+        ANALYSES.inc(query_type=query_type, source='cache')
+        return analysis, True
+
+    # A visually identical image analysed before: reuse its cached result
+    index = near_duplicates.get(query_type) if not prompt else None
+    if index is not None:
+        with stage('fingerprint'):
+            image_fingerprint = fingerprint(image)
+        match = index.find(image_fingerprint)
+        analysis = result_cache.peek(match) if match is not None else None
+        if analysis is not None:
+            ANALYSES.inc(query_type=query_type, source='near_duplicate')
+            return analysis, True
+
+    def analyze_once():
+        # The previous leader may have filled the cache between our lookup and joining the flight
+        analysis = result_cache.peek(cache_key)
+        if analysis is not None:
+            return analysis, True
+        with stage('analysis'):
+            analysis = run_analysis(query_type, image, text_input)
+        result_cache.set(cache_key, analysis)
+        if index is not None:
+            index.add(image_fingerprint, cache_key)
+        return analysis, False
+
+    # Identical requests already in flight wait for that call instead of starting their own
+    (analysis, cached), shared = in_flight.do(cache_key, analyze_once)
+    ANALYSES.inc(query_type=query_type, source='coalesced' if shared else 'cache' if cached else 'model')
+    return analysis, cached or shared
+
+def analyze_frames(query_type, filename, data, text_input=''):
+    # Only distinct keyframes are analysed, concurrently, then merged into one result
+    target = preprocessor.target_size(query_type)
+    with stage('keyframes'):
+        keyframes, scanned = select_keyframes(
+            iter_frames(filename, data, max_pixels=preprocessor.max_pixels, decode_slot=preprocessor.decode_slot),
+            prepare=lambda frame: preprocessor.downscale(frame, target)
+        )
+
+    def analyze_frame(frame_index, timestamp, image):
+        with query_type_context(query_type):
+            analysis, cached = cached_analysis(query_type, image, text_input)
+        return {'frame_index': frame_index, 'timestamp_ms': timestamp, 'analysis': analysis, 'cached': cached}
+
+    with ThreadPoolExecutor(max_workers=FRAME_ANALYSIS_CONCURRENCY, thread_name_prefix='frames') as executor:
+        frames = list(executor.map(lambda keyframe: analyze_frame(*keyframe), keyframes))
+
+    logger.info(f"Analyzed {len(frames)} keyframes out of {scanned} scanned frames of {filename}")
+    return {
+        'analysis': aggregate_results([frame['analysis'] for frame in frames]),
+        'frames': frames,
+        'frames_scanned': scanned,
+        'cached': all(frame['cached'] for frame in frames)
+    }
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -98,25 +418,19 @@ def analyze():
         query_type = request.form.get('query_type', 'general')
         text_input = request.form.get('input', '')
 
-        if not image_file or not allowed_file(image_file.filename):
+        if not image_file or not allowed_file(image_file.filename, ANALYZE_EXTENSIONS):
             logger.error('Invalid or missing image file')
             return jsonify({'error': 'Invalid or missing image file'}), 400
 
-        # Save the uploaded file with timestamp
-        filename = secure_filename(image_file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-        # Save the file
-        image_file.save(filepath)
+        if query_type not in QUERY_TYPES:
+            return jsonify({'error': 'Invalid query type'}), 400
 
         # Process image
         try:
-            image = Image.open(filepath).convert('RGB')
-            if image.size[0] > 4096 or image.size[1] > 4096:
-                image = image.resize((4096, 4096), Image.Resampling.LANCZOS)
-                image.save(filepath)
+            image, stored_filename, data = ingest_upload(image_file, query_type, allow_multiframe=True)
+        except (UploadTooLargeError, ImageTooLargeError) as e:
+            logger.warning(f"Upload rejected: {str(e)}")
+            return jsonify({'error': str(e)}), 413
         except Exception as e:
             logger.error(f"Image processing error: {str(e)}")
             return jsonify({'error': f'Image processing error: {str(e)}'}), 400
@@ -124,38 +438,35 @@ def analyze():
         results = {
             'query_type': query_type,
             'analysis': {},
-            'image_path': f'/static/uploads/{unique_filename}',
+            'image_path': upload_url(stored_filename),
             'user_feedback': request.form.get('user_feedback', '')
         }
 
         # Analyze the image content
         try:
-            if query_type == 'general':
-                prompt = text_input if text_input else "Analyze this image in detail."
-                gemini_response = ml_models.get_gemini_response(prompt, image)
-                results['analysis']['gemini_response'] = gemini_response
+            if image is None:
+                # Per-frame results are not collected as training data
+                results.update(analyze_frames(query_type, secure_filename(image_file.filename), data, text_input))
+                return jsonify(results)
 
-            elif query_type == 'classification':
-                classifications = ml_models.image_classifier.predict(image)
-                results['analysis']['classification'] = {'predictions': classifications}
+            results['analysis'], results['cached'] = cached_analysis(query_type, image, text_input)
 
-            elif query_type == 'object_detection':
-                object_detections = ml_models.object_detector.detect(image)
-                results['analysis']['objects'] = object_detections
+            if not results['cached']:
+                collect_training_sample(
+                    query_type, results['analysis'], data, stored_filename,
+                    secure_filename(image_file.filename), results['user_feedback']
+                )
 
-            elif query_type == 'sentiment':
-                text_input = request.form.get('input', '')  # Make text input optional
-                sentiment = ml_models.sentiment_analyzer.analyze(image, text_input if text_input else None)
-                results['analysis']['sentiment'] = sentiment['ensemble_prediction']
-
-            elif query_type == 'text_extraction':
-                extracted_text = ml_models.text_extractor.extract(image)
-                results['analysis']['extracted_text'] = extracted_text
+            return jsonify(results)
 
-            else:
-                return jsonify({'error': 'Invalid query type'}), 400
+        except ImageTooLargeError as e:
+            # Video and GIF frame sizes are only known once frame decoding starts
+            logger.warning(f"Upload rejected: {str(e)}")
+            return jsonify({'error': str(e)}), 413
 
-            return jsonify(results)
+        except GeminiUnavailableError as e:
+            logger.warning(f"Analysis rejected: {str(e)}")
+            return jsonify({'error': str(e)}), 503
 
         except Exception as e:
             logger.error(f"Analysis error: {str(e)}")
@@ -165,11 +476,223 @@ def analyze():
         logger.error(f"Request processing error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def analyze_batch_item(index, filename, data, query_type, text_input):
+    result = {'index': index, 'filename': filename, 'query_type': query_type}
+    try:
+        with query_type_context(query_type), reserve_memory(len(data)):
+            image = preprocessor.load(data, query_type)
+            result['analysis'], result['cached'] = cached_analysis(query_type, image, text_input)
+    except Exception as e:
+        logger.error(f"Batch analysis error for {filename}: {str(e)}")
+        result['error'] = str(e)
+    return result
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    files = request.files.getlist('images') + request.files.getlist('image')
+    query_type = request.form.get('query_type', 'general')
+    text_input = request.form.get('input', '')
+
+    if not files:
+        return jsonify({'error': 'No images provided'}), 400
+
+    if query_type not in QUERY_TYPES:
+        return jsonify({'error': 'Invalid query type'}), 400
+
+    for image_file in files:
+        if not (allowed_file(image_file.filename) or is_archive(image_file.filename)):
+            return jsonify({'error': f'Unsupported file: {image_file.filename}'}), 400
+
+    try:
+        concurrency = int(request.form.get('concurrency', BATCH_MAX_CONCURRENCY))
+    except ValueError:
+        return jsonify({'error': 'Invalid concurrency'}), 400
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+    # The response is streamed after the request is torn down, so take ownership
+    # of the uploaded data first; large archives spill over to a temp file
+    uploads = []
+    for image_file in files:
+        stream = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        shutil.copyfileobj(image_file.stream, stream)
+        stream.seek(0)
+        uploads.append((image_file.filename, stream))
+
+    def to_line(result):
+        return json.dumps(result) + '\n'
+
+    # The body is generated after the request is torn down, so the workers run in a copy of
+    # the request's context and the peak is recorded once the stream is done
+    context = contextvars.copy_context()
+    tracker = memory_tracker()
+
+    def generate():
+        try:
+            yield from generate_lines()
+        finally:
+            if tracker is not None:
+                REQUEST_MEMORY_BYTES.observe(tracker.peak, endpoint='analyze_batch')
+
+    def generate_lines():
+        # Keep a small window of submitted work so archives are read lazily and
+        # results are written out in completion order
+        pending = set()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch') as executor:
+            index = 0
+            try:
+                for upload in uploads:
+                    # A corrupt archive only ends its own entries; later uploads still run
+                    try:
+                        for filename, data in iter_uploaded_images([upload], MAX_UPLOAD_BYTES):
+                            if not allowed_file(filename):
+                                yield to_line({'index': index, 'filename': filename,
+                                               'error': 'Unsupported file type'})
+                            elif data is None:
+                                yield to_line({'index': index, 'filename': filename,
+                                               'error': f'File exceeds {MAX_UPLOAD_BYTES} bytes'})
+                            else:
+                                pending.add(executor.submit(
+                                    context.copy().run, analyze_batch_item,
+                                    index, filename, data, query_type, text_input
+                                ))
+                            index += 1
+
+                            while len(pending) >= concurrency * 2:
+                                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                                for future in done:
+                                    yield to_line(future.result())
+                    except ValueError as e:
+                        yield to_line({'index': index, 'filename': upload[0], 'error': str(e)})
+                        index += 1
+
+            finally:
+                for _, stream in uploads:
+                    stream.close()
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield to_line(future.result())
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def run_analysis_job(job, query_type, image, text_input):
+    with query_type_context(query_type):
+        return _run_analysis_job(job, query_type, image, text_input)
+
+def _run_analysis_job(job, query_type, image, text_input):
+    if query_type != 'general':
+        analysis, cached = cached_analysis(query_type, image, text_input)
+        return {'query_type': query_type, 'analysis': analysis, 'cached': cached}
+
+    cache_key = image_cache_key(image, query_type, text_input)
+    analysis = result_cache.get(cache_key)
+    if analysis is not None:
+        job.publish('partial', {'text': analysis['gemini_response']})
+        return {'query_type': query_type, 'analysis': analysis, 'cached': True}
+
+    # Forward partial text to subscribers as it arrives
+    prompt = text_input if text_input else "Analyze this image in detail."
+    chunks = []
+    for text in ml_models.stream_gemini_response(prompt, image):
+        chunks.append(text)
+        job.publish('partial', {'text': text})
+
+    analysis = {'gemini_response': ''.join(chunks)}
+    result_cache.set(cache_key, analysis)
+    return {'query_type': query_type, 'analysis': analysis, 'cached': False}
+
+@app.route('/analyze/jobs', methods=['POST'])
+def submit_analysis_job():
+    image_file = request.files.get('image')
+    query_type = request.form.get('query_type', 'general')
+    text_input = request.form.get('input', '')
+
+    if not image_file or not allowed_file(image_file.filename):
+        return jsonify({'error': 'Invalid or missing image file'}), 400
+
+    if query_type not in QUERY_TYPES:
+        return jsonify({'error': 'Invalid query type'}), 400
+
+    try:
+        image, stored_filename, data = ingest_upload(image_file, query_type)
+    except (UploadTooLargeError, ImageTooLargeError) as e:
+        logger.warning(f"Upload rejected: {str(e)}")
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        logger.error(f"Image processing error: {str(e)}")
+        return jsonify({'error': f'Image processing error: {str(e)}'}), 400
+
+    try:
+        job = job_manager.submit(run_analysis_job, query_type, image, text_input)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+
+    return jsonify({
+        'job_id': job.job_id,
+        'status': job.status,
+        'image_path': upload_url(stored_filename),
+        'status_url': f'/analyze/jobs/{job.job_id}',
+        'events_url': f'/analyze/jobs/{job.job_id}/events'
+    }), 202
+
+@app.route('/analyze/jobs/<job_id>')
+def get_analysis_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/analyze/jobs/<job_id>/events')
+def stream_analysis_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+
+    def generate():
+        for index, event, data in job.events(start=start):
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield f"id: {index}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def max_rss_bytes():
+    # High-water mark of the whole process; per-request figures are in imageiq_request_peak_memory_bytes
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+@app.route('/stats')
+def stats():
+    stats = {'result_cache': result_cache.stats(), 'jobs': job_manager.stats(),
+             'in_flight': in_flight.stats(),
+             'near_duplicates': {query_type: index.stats() for query_type, index in near_duplicates.items()},
+             'gemini': get_client().stats()}
+    if training_collector is not None:
+        stats['training_collector'] = training_collector.stats()
+    stats['local_batching'] = ml_models.batcher_stats()
+    stats['memory'] = {'max_rss_bytes': max_rss_bytes()}
+    return jsonify(stats)
+
 # Add error handlers
 @app.errorhandler(404)
 def not_found_error(error):
     return jsonify({'error': 'Resource not found'}), 404
 
+@app.errorhandler(413)
+def request_too_large_error(error):
+    return jsonify({'error': f'Request exceeds {MAX_REQUEST_BYTES} bytes'}), 413
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
@@ -177,6 +700,38 @@ def internal_error(error):
 @app.before_request
 def log_request_info():
     logger.info(f"Request Path: {request.path}, Method: {request.method}")
+    g.request_start = time.perf_counter()
+    # Label stage timings with the query type; unknown values collapse to 'none'
+    query_type = request.values.get('query_type', 'general') if request.method == 'POST' else 'none'
+    g.query_type_token = set_query_type(query_type if query_type in QUERY_TYPES else 'none')
+    g.memory_token = start_memory_tracking()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    memory_token = g.pop('memory_token', None)
+    if memory_token is not None:
+        peak = finish_memory_tracking(memory_token)
+        # A streamed body has not been produced yet; its route records the peak when it ends
+        if not response.is_streamed:
+            REQUEST_MEMORY_BYTES.observe(peak, endpoint=request.endpoint or 'unknown')
+            response.headers['X-Peak-Memory-Bytes'] = str(peak)
+    return response
+
+@app.teardown_request
+def reset_request_context(error=None):
+    token = g.pop('query_type_token', None)
+    if token is not None:
+        reset_query_type(token)
+    memory_token = g.pop('memory_token', None)
+    if memory_token is not None:
+        finish_memory_tracking(memory_token)
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/test_gemini', methods=['POST'])
 def test_gemini():
@@ -186,15 +741,14 @@ def test_gemini():
     if not image_file or not allowed_file(image_file.filename):
         return jsonify({'error': 'Invalid or missing image file'}), 400
 
-    # Save the uploaded file temporarily
-    filename = secure_filename(image_file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    image_file.save(filepath)
-
     try:
-        image = Image.open(filepath).convert('RGB')
+        image, _, _ = ingest_upload(image_file)
         response_text = ml_models.get_gemini_response(prompt, image)
         return jsonify({'response': response_text}), 200
+    except (UploadTooLargeError, ImageTooLargeError) as e:
+        return jsonify({'error': str(e)}), 413
+    except GeminiUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+
+from models.gemini_client import GeminiClient, set_client
+
+# Recorded-style responses, picked by the section markers present in the prompt
+CLASSIFICATION_RESPONSE = """**1. PRIMARY SUBJECT:**
+- A tabby cat sitting on a windowsill
+- Category: domestic animal / pet photography
+
+**2. SCENE CLASSIFICATION:**
+- Indoor, residential living room
+- Daytime, soft natural light from the window
+- Indoor
+
+**3. STYLE & COMPOSITION:**
+- Candid photographic style
+- Warm color scheme dominated by browns and creams
+- Rule of thirds, subject on the left
+
+**4. TECHNICAL DETAILS:**
+- Good sharpness on the subject, shallow depth of field
+- Slight highlight clipping in the window
+
+**5. ADDITIONAL CATEGORIES:**
+- Pets, animals, lifestyle
+- cat, window, cozy, home
+"""
+
+OBJECT_DETECTION_RESPONSE = """**1. MAIN OBJECTS:**
+- Cat
+- Windowsill
+- Potted plant
+
+**2. BACKGROUND:**
+- Curtains
+- Blurred street outside the window
+
+**3. DETAILS:**
+- The cat has green eyes and a striped coat
+- The plant has broad dark leaves
+
+**4. RELATIONSHIPS:**
+- The cat sits to the left of the potted plant on the windowsill
+
+**5. DISTINCTIVE FEATURES:**
+- Strong backlight creating a rim light around the cat
+"""
+
+SENTIMENT_RESPONSE = """**1. OVERALL SENTIMENT:**
+- POSITIVE
+- Emotional intensity: moderate
+- Calm, warm lighting
+
+**2. EMOTIONAL COMPONENTS:**
+- Contentment
+- Comfort
+- Curiosity
+
+**3. CONTEXTUAL ANALYSIS:**
+- Peaceful domestic atmosphere
+- Warm tones suggest comfort and safety
+
+**4. SEMANTIC INSIGHTS:**
+- Home as a place of rest
+- Companionship
+"""
+
+TEXT_RESPONSE = """OPEN
+Mon - Fri 9:00 - 17:00
+Welcome
+"""
+
+GENERAL_RESPONSE = ("The image shows a tabby cat sitting on a sunlit windowsill next to a potted plant. "
+                    "The room is warm and softly lit, and the street outside is blurred. ") * 4
+
+COMBINED_RESPONSE = "\n".join([
+    "=== DESCRIPTION ===", GENERAL_RESPONSE,
+    "=== CLASSIFICATION ===", CLASSIFICATION_RESPONSE,
+    "=== OBJECTS ===", OBJECT_DETECTION_RESPONSE,
+    "=== SENTIMENT ===", SENTIMENT_RESPONSE,
+    "=== TEXT ===", TEXT_RESPONSE,
+])
+
+RESPONSES = {
+    'classification': CLASSIFICATION_RESPONSE,
+    'object_detection': OBJECT_DETECTION_RESPONSE,
+    'sentiment': SENTIMENT_RESPONSE,
+    'text_extraction': TEXT_RESPONSE,
+    'general': GENERAL_RESPONSE,
+    'all': COMBINED_RESPONSE,
+}
+
+
+def response_for(prompt):
+    if '=== DESCRIPTION ===' in prompt:
+        return COMBINED_RESPONSE
+    if 'classification analysis' in prompt:
+        return CLASSIFICATION_RESPONSE
+    if 'List all objects' in prompt:
+        return OBJECT_DETECTION_RESPONSE
+    if 'emotional content' in prompt or 'sentiment analysis' in prompt:
+        return SENTIMENT_RESPONSE
+    if 'Extract all text' in prompt:
+        return TEXT_RESPONSE
+    return GENERAL_RESPONSE
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    # Stand-in for genai.GenerativeModel: sleeps for latency +/- jitter seconds, then answers
+    def __init__(self, model_name, latency=0.5, jitter=0.1, seed=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        prompt = contents if isinstance(contents, str) else next(
+            (part for part in contents if isinstance(part, str)), '')
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+
+        text = response_for(prompt)
+        if stream:
+            size = max(1, len(text) // 8)
+            return iter([FakeResponse(text[start:start + size]) for start in range(0, len(text), size)])
+        return FakeResponse(text)
+
+
+def install(latency=0.5, jitter=0.1, seed=0):
+    # Route the app's shared Gemini client to the fake, without rate limiting or retries
+    models = {}
+
+    def factory(model_name):
+        models[model_name] = FakeGenerativeModel(model_name, latency, jitter, seed)
+        return models[model_name]
+
+    set_client(GeminiClient(model_factory=factory, requests_per_minute=0, max_retries=0,
+                            max_concurrency=1024))
+    return models
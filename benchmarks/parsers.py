@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fake_gemini
+from models.ensemble import CombinedAnalysisEnsemble
+from models.parsing import (
+    parse_classification_response,
+    parse_object_detection_response,
+    parse_sentiment_response
+)
+
+
+def variants(text):
+    # The recorded response plus the layouts models drift into
+    return {
+        'recorded': text,
+        'no_blank_lines': '\n'.join(line for line in text.splitlines() if line.strip()),
+        'plain_headers': text.replace('**', ''),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the model response parsers")
+    parser.add_argument('--number', type=int, default=2000, help="Parses per timing run")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing runs; the fastest is reported")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    combined = CombinedAnalysisEnsemble()
+    cases = {
+        'classification': (parse_classification_response, fake_gemini.CLASSIFICATION_RESPONSE),
+        'object_detection': (parse_object_detection_response, fake_gemini.OBJECT_DETECTION_RESPONSE),
+        'sentiment': (parse_sentiment_response, fake_gemini.SENTIMENT_RESPONSE),
+        'all': (combined._build_result, fake_gemini.COMBINED_RESPONSE),
+    }
+
+    results = []
+    for name, (parse, response) in cases.items():
+        for variant, text in variants(response).items():
+            best = min(timeit.repeat(lambda: parse(text), number=args.number, repeat=args.repeat))
+            results.append({
+                'name': f"parse:{name}:{variant}",
+                'response_chars': len(text),
+                'us_per_parse': round(best / args.number * 1e6, 3),
+            })
+            print(f"{results[-1]['name']}: {results[-1]['us_per_parse']} us")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
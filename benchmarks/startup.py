@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Time from interpreter start to a ready Flask app, measured in a fresh process each run
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import app
+ready = time.perf_counter()
+{warm_up}
+print(ready - start, time.perf_counter() - ready)
+"""
+
+
+def measure(runs, warm_up_query_types=None):
+    warm_up = f"app.ml_models.warm_up({warm_up_query_types!r})" if warm_up_query_types else ''
+    env = dict(os.environ, GOOGLE_API_KEY=os.getenv('GOOGLE_API_KEY', 'benchmark'))
+    import_times, warm_up_times = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET.format(warm_up=warm_up)],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        import_time, warm_up_time = (float(value) for value in output.split())
+        import_times.append(import_time)
+        warm_up_times.append(warm_up_time)
+
+    return {
+        'runs': runs,
+        'import_median_s': statistics.median(import_times),
+        'import_max_s': max(import_times),
+        'warm_up_query_types': warm_up_query_types,
+        'warm_up_median_s': statistics.median(warm_up_times) if warm_up_query_types else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import and warm-up time")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warm-up', default='', help="Comma separated query types to warm up")
+    parser.add_argument('--max-seconds', type=float,
+                        help="Exit non-zero when the median import time exceeds this budget")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    query_types = [query_type for query_type in args.warm_up.split(',') if query_type] or None
+    results = measure(args.runs, query_types)
+    print(json.dumps(results, indent=4))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.max_seconds is not None and results['import_median_s'] > args.max_seconds:
+        print(f"Startup regression: {results['import_median_s']:.3f}s > {args.max_seconds:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Keep benchmark runs off the real upload folder, the result cache and the training data
+os.environ.setdefault('GOOGLE_API_KEY', 'benchmark')
+os.environ.setdefault('UPLOAD_PERSIST_MODE', 'none')
+os.environ.setdefault('COLLECT_TRAINING_DATA', 'false')
+
+import numpy as np
+from PIL import Image
+
+from benchmarks import fake_gemini
+from models.metrics import STAGE_SECONDS
+
+DEFAULT_SIZES = [(640, 480), (1600, 1200), (4000, 3000)]
+DEFAULT_FORMATS = ['JPEG', 'PNG', 'GIF']
+HTTP_QUERY_TYPES = ['general', 'classification', 'object_detection', 'sentiment', 'text_extraction', 'all']
+ENSEMBLES = {
+    'classification': ('image_classifier', 'predict'),
+    'object_detection': ('object_detector', 'detect'),
+    'sentiment': ('sentiment_analyzer', 'analyze'),
+    'text_extraction': ('text_extractor', 'extract'),
+    'all': ('combined_analyzer', 'analyze'),
+}
+
+
+def synthetic_image(size, seed):
+    # Smooth random texture: compresses like a photo rather than like noise or a flat fill
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(2, size[1] // 64), max(2, size[0] // 64), 3), dtype=np.uint8)
+    image = Image.fromarray(small, 'RGB').resize(size, Image.Resampling.BICUBIC)
+    detail = rng.integers(-12, 13, (size[1], size[0], 3), dtype=np.int16)
+    return Image.fromarray(np.clip(np.asarray(image, dtype=np.int16) + detail, 0, 255).astype(np.uint8), 'RGB')
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'GIF':
+        image = image.convert('P', palette=Image.Palette.ADAPTIVE)
+    image.save(buffer, format=image_format, **({'quality': 90} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def build_corpus(sizes, formats, variants, seed):
+    # [(filename, bytes, size, format)], distinct pixels per entry so results are never shared
+    corpus = []
+    for size in sizes:
+        for image_format in formats:
+            for variant in range(variants):
+                image = synthetic_image(size, seed + len(corpus))
+                extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+                corpus.append((f"bench_{size[0]}x{size[1]}_{variant}.{extension}", encode(image, image_format),
+                               size, image_format))
+    return corpus
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def stage_breakdown(before, after):
+    # Mean milliseconds and call count per stage (summed over query types) between two snapshots
+    stages = {}
+    for key, (total, count) in after.items():
+        previous_total, previous_count = before.get(key, (0.0, 0))
+        if count == previous_count:
+            continue
+        entry = stages.setdefault(key[0], [0.0, 0])
+        entry[0] += total - previous_total
+        entry[1] += count - previous_count
+    return {name: {'mean_ms': round(total / count * 1000, 3), 'count': count}
+            for name, (total, count) in sorted(stages.items())}
+
+
+def run_load(name, call, items, concurrency):
+    # Runs call(item) for every item on `concurrency` threads and summarises the latencies
+    latencies, errors = [], []
+    lock = threading.Lock()
+    next_index = iter(range(len(items)))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            try:
+                call(items[index])
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    stages_before = STAGE_SECONDS.totals()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        'name': name,
+        'requests': len(items),
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'wall_s': round(wall, 4),
+        'throughput_rps': round(len(latencies) / wall, 3) if wall else None,
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p95_ms': _ms(percentile(latencies, 0.95)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stage_breakdown(stages_before, STAGE_SECONDS.totals()),
+    }
+    if errors:
+        result['first_error'] = errors[0]
+    print(f"{name}: {result['throughput_rps']} req/s, p50 {result['p50_ms']} ms, "
+          f"p99 {result['p99_ms']} ms, {result['errors']} errors")
+    return result
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def bench_http(app_module, corpus, requests, concurrency):
+    results = []
+    work = [corpus[index % len(corpus)] for index in range(requests)]
+
+    for query_type in HTTP_QUERY_TYPES:
+        def call(entry, query_type=query_type):
+            filename, data = entry[0], entry[1]
+            response = app_module.app.test_client().post('/analyze', data={
+                'query_type': query_type, 'image': (io.BytesIO(data), filename)})
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.get_json()}")
+
+        app_module.result_cache.clear()
+        results.append(run_load(f"http:/analyze:{query_type}", call, work, concurrency))
+
+    def call_test_gemini(entry):
+        response = app_module.app.test_client().post('/test_gemini', data={
+            'prompt': 'Describe this image.', 'image': (io.BytesIO(entry[1]), entry[0])})
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_json()}")
+
+    results.append(run_load("http:/test_gemini", call_test_gemini, work, concurrency))
+    return results
+
+
+def bench_ensembles(app_module, corpus, requests, concurrency):
+    # Calls the ensembles directly on decoded images, skipping Flask and ingestion
+    results = []
+    images = [app_module.preprocessor.load(entry[1], 'general') for entry in corpus]
+    work = [images[index % len(images)] for index in range(requests)]
+
+    for query_type, (model_name, method) in ENSEMBLES.items():
+        call = getattr(getattr(app_module.ml_models, model_name), method)
+        results.append(run_load(f"ensemble:{query_type}", call, work, concurrency))
+    return results
+
+
+def bench_data(sample_counts, seed):
+    from models.data_collector import DataCollector
+
+    results = []
+    image_bytes = encode(synthetic_image((256, 256), seed), 'JPEG')
+    analysis = {'classification': {'predictions': {'primary_subject': ['cat']}}}
+
+    for count in sample_counts:
+        with tempfile.TemporaryDirectory(prefix='imageiq-bench-') as base_path:
+            # Every sample reuses one image, so near-duplicate skipping has to be off
+            collector = DataCollector(base_path, near_duplicate_distance=-1)
+            latencies = []
+            started = time.perf_counter()
+            for index in range(count):
+                start = time.perf_counter()
+                collector.collect_training_data(None, analysis, 'classification', image_bytes=image_bytes,
+                                                image_filename=f"sample_{index}.jpg")
+                latencies.append(time.perf_counter() - start)
+            wall = time.perf_counter() - started
+            latencies.sort()
+            results.append({
+                'name': f"data:collect_training_data:{count}",
+                'requests': count,
+                'wall_s': round(wall, 4),
+                'throughput_rps': round(count / wall, 3),
+                'p50_ms': _ms(percentile(latencies, 0.50)),
+                'p95_ms': _ms(percentile(latencies, 0.95)),
+                'p99_ms': _ms(percentile(latencies, 0.99)),
+                'peak_rss_mb': peak_rss_mb(),
+            })
+            print(f"{results[-1]['name']}: {results[-1]['throughput_rps']} samples/s")
+
+            results.append(bench_dataset(base_path, count))
+    return results
+
+
+def bench_dataset(base_path, count):
+    try:
+        from models.trainer import CustomDataset
+    except ImportError as e:
+        print(f"data:custom_dataset:{count}: skipped ({str(e)})")
+        return {'name': f"data:custom_dataset:{count}", 'skipped': str(e)}
+
+    started = time.perf_counter()
+    dataset = CustomDataset(base_path)
+    loaded = time.perf_counter()
+    for index in range(len(dataset)):
+        dataset[index]
+    iterated = time.perf_counter()
+
+    result = {
+        'name': f"data:custom_dataset:{count}",
+        'requests': len(dataset),
+        'load_s': round(loaded - started, 4),
+        'iterate_s': round(iterated - loaded, 4),
+        'throughput_rps': round(len(dataset) / (iterated - loaded), 3) if len(dataset) else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    print(f"{result['name']}: load {result['load_s']}s, {result['throughput_rps']} samples/s")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    # Prints the relative change of the headline numbers against an earlier results file
+    with open(baseline_path, 'r') as f:
+        baseline = {result['name']: result for result in json.load(f)['results']}
+
+    print(f"\nChange vs {baseline_path}:")
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous is None:
+            continue
+        changes = []
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb'):
+            old, new = previous.get(metric), result.get(metric)
+            if old and new is not None:
+                changes.append(f"{metric} {(new - old) / old * 100:+.1f}%")
+        print(f"  {result['name']}: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline against a fake Gemini backend")
+    parser.add_argument('--suites', default='http,ensembles,data',
+                        help="Comma separated subset of http, ensembles, data")
+    parser.add_argument('--latency', type=float, default=0.5, help="Fake Gemini latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.1, help="Fake Gemini latency jitter in seconds")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per HTTP/ensemble scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--variants', type=int, default=2, help="Distinct images per size and format")
+    parser.add_argument('--sizes', default=','.join(f"{w}x{h}" for w, h in DEFAULT_SIZES))
+    parser.add_argument('--formats', default=','.join(DEFAULT_FORMATS))
+    parser.add_argument('--data-samples', default='10000,100000',
+                        help="Comma separated sample counts for the data suite")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    suites = set(args.suites.split(','))
+    sizes = [tuple(int(value) for value in size.split('x')) for size in args.sizes.split(',')]
+    formats = [image_format.upper() for image_format in args.formats.split(',')]
+
+    # The result cache would turn every repeat into a hit; measure the full pipeline instead
+    os.environ['RESULT_CACHE_SIZE'] = '0'
+    os.environ.pop('RESULT_CACHE_DIR', None)
+    fake_gemini.install(args.latency, args.jitter, args.seed)
+
+    results = []
+    if suites & {'http', 'ensembles'}:
+        import app as app_module
+
+        # Per-request INFO logging would dominate the profile
+        logging.getLogger().setLevel(logging.WARNING)
+        corpus = build_corpus(sizes, formats, args.variants, args.seed)
+        print(f"Corpus: {len(corpus)} images, {sum(len(entry[1]) for entry in corpus) / 1e6:.1f} MB")
+        if 'http' in suites:
+            results.extend(bench_http(app_module, corpus, args.requests, args.concurrency))
+        if 'ensembles' in suites:
+            results.extend(bench_ensembles(app_module, corpus, args.requests, args.concurrency))
+    if 'data' in suites:
+        results.extend(bench_data([int(count) for count in args.data_samples.split(',') if count], args.seed))
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import logging
+import os
+import tarfile
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+def is_archive(filename):
+    lowered = (filename or '').lower()
+    return lowered.endswith(ZIP_SUFFIXES) or lowered.endswith(TAR_SUFFIXES)
+
+
+def iter_uploaded_images(uploads, max_member_bytes=None):
+    # Yields (filename, bytes) for each plain upload and each member of an uploaded archive.
+    # Plain files and members larger than max_member_bytes come back as (filename, None).
+    for filename, stream in uploads:
+        lowered = (filename or '').lower()
+
+        if lowered.endswith(ZIP_SUFFIXES):
+            yield from _iter_zip(stream, filename, max_member_bytes)
+        elif lowered.endswith(TAR_SUFFIXES):
+            yield from _iter_tar(stream, filename, max_member_bytes)
+        elif max_member_bytes is not None:
+            data = stream.read(max_member_bytes + 1)
+            yield filename, data if len(data) <= max_member_bytes else None
+        else:
+            yield filename, stream.read()
+
+
+def _too_large(size, max_member_bytes):
+    return max_member_bytes is not None and size > max_member_bytes
+
+
+def _skip_member(name):
+    basename = os.path.basename(name)
+    return not basename or basename.startswith('.') or name.startswith('__MACOSX/')
+
+
+def _iter_zip(stream, archive_name, max_member_bytes):
+    try:
+        with zipfile.ZipFile(stream) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _skip_member(info.filename):
+                    continue
+                # Extraction stops at the declared size, so checking it bounds the read
+                if _too_large(info.file_size, max_member_bytes):
+                    yield info.filename, None
+                    continue
+                yield info.filename, archive.read(info)
+    except zipfile.BadZipFile as e:
+        logger.error(f"Invalid zip archive {archive_name}: {str(e)}")
+        raise ValueError(f"Invalid zip archive {archive_name}")
+
+
+def _iter_tar(stream, archive_name, max_member_bytes):
+    try:
+        with tarfile.open(fileobj=stream, mode='r:*') as archive:
+            for member in archive:
+                if not member.isfile() or _skip_member(member.name):
+                    continue
+                if _too_large(member.size, max_member_bytes):
+                    yield member.name, None
+                    continue
+                extracted = archive.extractfile(member)
+                if extracted is not None:
+                    yield member.name, extracted.read()
+    except tarfile.TarError as e:
+        logger.error(f"Invalid tar archive {archive_name}: {str(e)}")
+        raise ValueError(f"Invalid tar archive {archive_name}")
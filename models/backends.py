@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Per query type backend selection: 'gemini', 'local' or 'local_first' (local, Gemini on miss/error)
+BACKEND_MODES = ('gemini', 'local', 'local_first')
+
+YOLO_WEIGHTS = os.getenv('YOLO_WEIGHTS', 'yolov8n.pt')
+YOLO_CONFIDENCE = float(os.getenv('YOLO_CONFIDENCE', '0.25'))
+EASYOCR_LANGUAGES = os.getenv('EASYOCR_LANGUAGES', 'en').split(',')
+LOCAL_CLASSIFIER_MODEL = os.getenv('LOCAL_CLASSIFIER_MODEL', 'google/vit-base-patch16-224')
+LOCAL_CLASSIFIER_TOP_K = int(os.getenv('LOCAL_CLASSIFIER_TOP_K', '5'))
+
+
+def backend_mode(env_name):
+    mode = os.getenv(env_name, 'gemini').lower()
+    if mode not in BACKEND_MODES:
+        raise ValueError(f"Invalid {env_name}: {mode}")
+    return mode
+
+
+class LazyBackend:
+    # Builds the local model on first use so workers that never need it pay nothing
+    def __init__(self, factory):
+        self.factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self.factory()
+        return self._instance
+
+
+def run_with_fallback(mode, local_call, gemini_call, is_empty, name):
+    if mode == 'gemini':
+        return gemini_call()
+
+    try:
+        result = local_call()
+        if mode == 'local' or not is_empty(result):
+            return result
+        logger.info(f"Local {name} found nothing, falling back to Gemini")
+    except Exception as e:
+        if mode == 'local':
+            raise
+        logger.warning(f"Local {name} failed, falling back to Gemini: {str(e)}")
+
+    return gemini_call()
+
+
+class YoloObjectDetector:
+    def __init__(self, weights=YOLO_WEIGHTS, confidence=YOLO_CONFIDENCE):
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.confidence = confidence
+        logger.info(f"Local YOLO detector loaded ({weights})")
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        # PIL images, not arrays: ultralytics reads numpy input as BGR and only converts PIL itself
+        results = self.model.predict(list(images), conf=self.confidence, device='cpu', verbose=False)
+        return [self._to_result(result) for result in results]
+
+    def _to_result(self, result):
+        names = result.names
+        detections = []
+        for box, cls, score in zip(result.boxes.xyxy.tolist(), result.boxes.cls.tolist(),
+                                   result.boxes.conf.tolist()):
+            detections.append((names[int(cls)], score, [round(value) for value in box]))
+        detections.sort(key=lambda detection: detection[1], reverse=True)
+
+        counts = {}
+        for label, _, _ in detections:
+            counts[label] = counts.get(label, 0) + 1
+
+        return {
+            'main_objects': [f"{label} x{count}" if count > 1 else label for label, count in counts.items()],
+            'background': [],
+            'details': [f"{label} at {box} ({score:.2f})" for label, score, box in detections],
+            'relationships': '',
+            'distinctive_features': []
+        }
+
+
+class EasyOCRTextExtractor:
+    def __init__(self, languages=EASYOCR_LANGUAGES):
+        import easyocr
+
+        self.reader = easyocr.Reader(languages, gpu=False)
+        logger.info(f"Local EasyOCR reader loaded ({','.join(languages)})")
+
+    def extract(self, image):
+        return self.extract_batch([image])[0]
+
+    def extract_batch(self, images):
+        # EasyOCR has no batched path for mixed image sizes, so this only amortises dispatch
+        return [self._extract_one(image) for image in images]
+
+    def _extract_one(self, image):
+        import numpy as np
+
+        detections = self.reader.readtext(np.asarray(image))
+
+        text_regions = []
+        for points, text, confidence in detections:
+            xs = [point[0] for point in points]
+            ys = [point[1] for point in points]
+            text_regions.append({
+                'text': text,
+                'box': [int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys))],
+                'confidence': float(confidence)
+            })
+
+        # Reading order: top to bottom, then left to right
+        text_regions.sort(key=lambda region: (region['box'][1], region['box'][0]))
+        return {
+            'printed_text': '\n'.join(region['text'] for region in text_regions),
+            'handwritten_text': '',
+            'text_regions': text_regions
+        }
+
+
+class TransformersImageClassifier:
+    def __init__(self, model_name=LOCAL_CLASSIFIER_MODEL, top_k=LOCAL_CLASSIFIER_TOP_K):
+        from transformers import pipeline
+
+        self.pipeline = pipeline('image-classification', model=model_name, device=-1)
+        self.top_k = top_k
+        logger.info(f"Local image classifier loaded ({model_name})")
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        # Without batch_size the pipeline runs one forward pass per image
+        outputs = self.pipeline(images, top_k=self.top_k, batch_size=len(images))
+        return [self._to_result(predictions) for predictions in outputs]
+
+    def _to_result(self, predictions):
+        labels = [f"{prediction['label']} ({prediction['score']:.2f})" for prediction in predictions]
+        return {
+            'primary_subject': labels[:1],
+            'scene_classification': [],
+            'style_composition': [],
+            'technical_details': [],
+            'additional_categories': labels[1:]
+        }
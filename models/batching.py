@@ -0,0 +1,94 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Per query type defaults for local inference batching; override with
+# LOCAL_BATCH_SIZE_<QUERY_TYPE> and LOCAL_BATCH_LATENCY_MS_<QUERY_TYPE>. A batch size of 1
+# calls the backend directly on the request thread.
+DEFAULT_BATCH_SETTINGS = {
+    'classification': (16, 10),
+    'object_detection': (8, 10),
+}
+
+
+def batch_settings(query_type):
+    max_batch_size, max_latency_ms = DEFAULT_BATCH_SETTINGS.get(query_type, (1, 0))
+    suffix = query_type.upper()
+    return {
+        'max_batch_size': int(os.getenv(f'LOCAL_BATCH_SIZE_{suffix}', max_batch_size)),
+        'max_latency_ms': float(os.getenv(f'LOCAL_BATCH_LATENCY_MS_{suffix}', max_latency_ms)),
+    }
+
+
+class MicroBatcher:
+    # Groups concurrent single-item calls into one batch_fn(items) call. A batch is
+    # dispatched when it reaches max_batch_size or max_latency_ms after its first item.
+    def __init__(self, batch_fn, max_batch_size=8, max_latency_ms=10, name='batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_latency = max(0.0, max_latency_ms) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._stats = {'items': 0, 'batches': 0, 'max_batch': 0}
+
+    def submit(self, item):
+        # Blocks until the batch containing item has run; returns its result or raises its error
+        if self.max_batch_size == 1:
+            self._record(1)
+            return self.batch_fn([item])[0]
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['mean_batch'] = round(stats['items'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['max_batch_size'] = self.max_batch_size
+        stats['max_latency_ms'] = self.max_latency * 1000.0
+        return stats
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def _record(self, size):
+        with self._lock:
+            self._stats['items'] += size
+            self._stats['batches'] += 1
+            self._stats['max_batch'] = max(self._stats['max_batch'], size)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._record(len(batch))
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.warning(f"{self.name} batch of {len(batch)} failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from models.storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+def image_cache_key(image, query_type, prompt=''):
+    # Key on the decoded pixels so re-uploads under a different filename still hit
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    hasher.update(image.tobytes())
+    hasher.update(b'\0' + query_type.encode('utf-8'))
+    hasher.update(b'\0' + (prompt or '').encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+        }
+
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+
+    def get(self, key):
+        return self._lookup(key, count=True)
+
+    def peek(self, key):
+        # Same lookup without touching hit/miss counts, for re-checks of a key already counted
+        return self._lookup(key, count=False)
+
+    def _lookup(self, key, count):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._is_expired(stored_at, now):
+                    self._entries.move_to_end(key)
+                    if count:
+                        self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                if count:
+                    self._stats['misses'] += 1
+                return None
+            if count:
+                self._stats['disk_hits'] += 1
+            self._put_memory(key, entry)
+            return entry[1]
+
+    def set(self, key, value):
+        entry = (time.time(), value)
+        with self._lock:
+            self._put_memory(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        stats['disk_enabled'] = bool(self.disk_path)
+        return stats
+
+    def _is_expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _put_memory(self, key, entry):
+        # Caller must hold the lock
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _disk_file(self, key):
+        return os.path.join(self.disk_path, key[:2], f"{key}.json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_path:
+            return None
+
+        path = self._disk_file(key)
+        try:
+            with open(path, 'r') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key}: {str(e)}")
+            self._remove_disk(path)
+            return None
+
+        if self._is_expired(payload['stored_at'], now):
+            with self._lock:
+                self._stats['expirations'] += 1
+            self._remove_disk(path)
+            return None
+
+        return payload['stored_at'], payload['value']
+
+    def _write_disk(self, key, entry):
+        if not self.disk_path:
+            return
+
+        path = self._disk_file(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write_json(path, {'stored_at': entry[0], 'value': entry[1]})
+        except Exception as e:
+            logger.warning(f"Failed to persist cache entry {key}: {str(e)}")
+
+    def _remove_disk(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+
+class BackgroundCollector:
+    def __init__(self, collector, max_queue_size=1000, batch_size=32,
+                 drop_policy='drop_newest', block_timeout=0.1):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Invalid drop policy: {drop_policy}")
+
+        self.collector = collector
+        self.batch_size = batch_size
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'collected': 0,
+            'failed': 0,
+            'batches': 0
+        }
+
+        self._worker = threading.Thread(target=self._run, name='training-collector', daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, record):
+        # Returns False when the record was dropped because the queue is full
+        if self._closed:
+            return False
+
+        try:
+            if self.drop_policy == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            elif self.drop_policy == 'drop_oldest':
+                self._put_evicting_oldest(record)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning("Training data queue full, dropping sample")
+            return False
+
+        self._count('enqueued')
+        return True
+
+    def flush(self):
+        # Block until every queued record has been written
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['depth'] = self._queue.qsize()
+        stats['capacity'] = self._queue.maxsize
+        stats['drop_policy'] = self.drop_policy
+        stats['skipped_duplicates'] = self.collector.skipped_duplicates
+        return stats
+
+    def _put_evicting_oldest(self, record):
+        while True:
+            try:
+                self._queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._count('dropped')
+                except queue.Empty:
+                    pass
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not None]
+            stopping = len(records) != len(batch)
+            # Anything queued behind the shutdown marker still gets written
+            if stopping:
+                while True:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(record)
+                    if record is not None:
+                        records.append(record)
+
+            try:
+                if records:
+                    collected = self.collector.collect_batch(records)
+                    self._count('collected', collected)
+                    self._count('failed', len(records) - collected)
+                    self._count('batches')
+            except Exception as e:
+                logger.error(f"Error writing training data batch: {str(e)}")
+                self._count('failed', len(records))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -1,12 +1,29 @@
+import io
+import logging
 import os
-import json
+import threading
 from datetime import datetime
 import shutil
+from models.metadata_store import MetadataStore
+from models.ids import new_id
+from models.storage import BlobStore, atomic_write_json
+from models.phash import BKTree, fingerprint_file, format_fingerprint, parse_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Samples within this hamming distance of an earlier sample of the same query type are
+# not stored again; set to -1 to keep every sample
+NEAR_DUPLICATE_DISTANCE = int(os.getenv('TRAINING_NEAR_DUPLICATE_DISTANCE', '4'))
 
 class DataCollector:
-    def __init__(self, base_path='static/training_data'):
+    def __init__(self, base_path='static/training_data', near_duplicate_distance=NEAR_DUPLICATE_DISTANCE):
         self.base_path = base_path
         self.metadata_file = os.path.join(base_path, 'metadata.json')
+        self.metadata_db = os.path.join(base_path, 'metadata.db')
+        self.near_duplicate_distance = near_duplicate_distance
+        self.skipped_duplicates = 0
+        self._fingerprints = {}
+        self._fingerprints_lock = threading.Lock()
         self.initialize_storage()
 
     def initialize_storage(self):
@@ -15,56 +32,146 @@ class DataCollector:
         for analysis_type in ['classification', 'object_detection', 'sentiment', 'text_extraction']:
             os.makedirs(os.path.join(self.base_path, analysis_type), exist_ok=True)
 
-        # Initialize metadata file if it doesn't exist
-        if not os.path.exists(self.metadata_file):
-            self._save_metadata({})
+        # Images are stored once per unique content and hard linked into sample directories
+        self.blobs = BlobStore(os.path.join(self.base_path, 'blobs'))
+
+        # Open the metadata store, importing the legacy JSON file on first use
+        self.metadata = MetadataStore(self.metadata_db)
+        self.metadata.migrate_from_json(self.metadata_file)
 
-    def collect_training_data(self, image_path, analysis_results, query_type, user_feedback=None):
+    def collect_training_data(self, image_path, analysis_results, query_type, user_feedback=None,
+                              image_bytes=None, image_filename=None):
         try:
-            # Generate unique ID for the training sample
-            sample_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            # Create directory for this sample
-            sample_dir = os.path.join(self.base_path, query_type, sample_id)
-            os.makedirs(sample_dir, exist_ok=True)
+            sample = self._write_sample(image_path, analysis_results, query_type, user_feedback,
+                                        image_bytes, image_filename)
+
+            # Record the sample in the metadata store
+            if sample is not None:
+                self.metadata.add(*sample)
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Error collecting training data: {str(e)}")
+            return False
+
+    def collect_batch(self, records):
+        # Write each sample directory, then record the whole batch in one transaction.
+        # Returns the number of records handled, i.e. collected or skipped as near-duplicates.
+        samples = []
+        handled = 0
+        for record in records:
+            try:
+                sample = self._write_sample(
+                    record.get('image_path'),
+                    record['analysis_results'],
+                    record['query_type'],
+                    record.get('user_feedback'),
+                    record.get('image_bytes'),
+                    record.get('image_filename')
+                )
+                handled += 1
+                if sample is not None:
+                    samples.append(sample)
+            except Exception as e:
+                logger.error(f"Error collecting training data: {str(e)}")
+
+        if samples:
+            self.metadata.add_many(samples)
+        return handled
+
+    def _write_sample(self, image_path, analysis_results, query_type, user_feedback=None,
+                      image_bytes=None, image_filename=None):
+        # Returns (sample_id, info), or None when the image is a near-duplicate of a stored sample
+        image_fingerprint = self._near_duplicate_check(query_type, image_path, image_bytes)
+        if image_fingerprint is False:
+            return None
 
-            # Copy image to training data directory
-            image_filename = os.path.basename(image_path)
-            shutil.copy2(image_path, os.path.join(sample_dir, image_filename))
+        # Generate unique ID for the training sample
+        sample_id = new_id()
+
+        # Build the sample in a hidden directory and rename it into place once complete
+        sample_dir = os.path.join(self.base_path, query_type, sample_id)
+        tmp_dir = os.path.join(self.base_path, query_type, f".tmp-{sample_id}")
+        os.makedirs(tmp_dir)
+
+        try:
+            # Link image into training data directory from the blob store, sharing the
+            # upload's inode when it is already on disk
+            image_filename = image_filename or os.path.basename(image_path)
+            extension = os.path.splitext(image_filename)[1].lower()
+            if image_path and (image_bytes is None or os.path.exists(image_path)):
+                blob, blob_path = self.blobs.put_file(image_path, extension)
+            else:
+                blob, blob_path = self.blobs.put_bytes(image_bytes, extension)
+            self.blobs.link(blob_path, os.path.join(tmp_dir, image_filename))
 
             # Save analysis results
-            with open(os.path.join(sample_dir, 'analysis.json'), 'w') as f:
-                json.dump(analysis_results, f, indent=4)
+            atomic_write_json(os.path.join(tmp_dir, 'analysis.json'), analysis_results, indent=4)
 
             # Save user feedback if available
             if user_feedback:
-                feedback_file = os.path.join(sample_dir, 'feedback.json')
-                with open(feedback_file, 'w') as f:
-                    json.dump({'feedback': user_feedback}, f, indent=4)
-
-            # Update metadata
-            metadata = self._load_metadata()
-            metadata[sample_id] = {
-                'timestamp': datetime.now().isoformat(),
-                'query_type': query_type,
-                'image_path': image_filename,
-                'status': 'collected'
-            }
-            self._save_metadata(metadata)
+                feedback_file = os.path.join(tmp_dir, 'feedback.json')
+                atomic_write_json(feedback_file, {'feedback': user_feedback}, indent=4)
 
-            return True
+            os.rename(tmp_dir, sample_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
 
-        except Exception as e:
-            print(f"Error collecting training data: {str(e)}")
-            return False
+        info = {
+            'timestamp': datetime.now().isoformat(),
+            'query_type': query_type,
+            'image_path': image_filename,
+            'blob': blob,
+            'status': 'collected'
+        }
+        if image_fingerprint is not None:
+            info['phash'] = format_fingerprint(image_fingerprint)
+            self._remember_fingerprint(query_type, image_fingerprint)
+        return sample_id, info
+
+    def _near_duplicate_check(self, query_type, image_path, image_bytes):
+        # Returns the image fingerprint, None if deduplication is off or the image can't be
+        # read, or False if a stored sample of this query type is within the distance
+        if self.near_duplicate_distance < 0:
+            return None
 
-    def _load_metadata(self):
         try:
-            with open(self.metadata_file, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-
-    def _save_metadata(self, metadata):
-        with open(self.metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=4) 
\ No newline at end of file
+            if image_bytes is not None:
+                image_fingerprint = fingerprint_file(io.BytesIO(image_bytes))
+            else:
+                image_fingerprint = fingerprint_file(image_path)
+        except Exception as e:
+            logger.error(f"Error fingerprinting training image: {str(e)}")
+            return None
+
+        color, dhash = image_fingerprint
+        with self._fingerprints_lock:
+            tree = self._fingerprint_tree(query_type, color)
+            if tree.find(dhash, self.near_duplicate_distance) is not None:
+                self.skipped_duplicates += 1
+                logger.info(f"Skipping near-duplicate {query_type} training sample")
+                return False
+        return image_fingerprint
+
+    def _remember_fingerprint(self, query_type, image_fingerprint):
+        color, dhash = image_fingerprint
+        with self._fingerprints_lock:
+            self._fingerprint_tree(query_type, color).add(dhash, True)
+
+    def _fingerprint_tree(self, query_type, color):
+        # Caller must hold the lock. Trees are loaded from the metadata store on first use.
+        trees = self._fingerprints.get(query_type)
+        if trees is None:
+            trees = self._fingerprints[query_type] = {}
+            for _, info in self.metadata.find(query_type=query_type):
+                if info.get('phash'):
+                    stored_color, stored_dhash = parse_fingerprint(info['phash'])
+                    trees.setdefault(stored_color, BKTree()).add(stored_dhash, True)
+        return trees.setdefault(color, BKTree())
+
+    def gc_blobs(self, dry_run=False, min_age=3600):
+        # Delete blobs that are no longer referenced by any sample
+        referenced = {info['blob'] for _, info in self.metadata.find() if info.get('blob')}
+        return self.blobs.gc(referenced, dry_run=dry_run, min_age=min_age)
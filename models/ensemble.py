@@ -1,28 +1,87 @@
-import google.generativeai as genai
-from PIL import Image
+import contextvars
 import logging
-import os
-from dotenv import load_dotenv
+import re
+from concurrent.futures import ThreadPoolExecutor
+from models.gemini_client import create_model
+from models.preprocessing import ImagePreprocessor, encode_image
+from models.batching import MicroBatcher, batch_settings
+from models.metrics import log_response, stage
+from models.parsing import (
+    parse_classification_response,
+    parse_object_detection_response,
+    parse_sentiment_response
+)
+from models.tiling import TEXT_TILE_CONCURRENCY, make_tiles, merge_tile_lines, should_tile
+from models.backends import (
+    LazyBackend,
+    run_with_fallback,
+    backend_mode,
+    YoloObjectDetector,
+    EasyOCRTextExtractor,
+    TransformersImageClassifier
+)
 
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+def build_sentiment_result(sentiment_analysis):
+    return {
+        'ensemble_prediction': sentiment_analysis,
+        'individual_predictions': {
+            'gemini': {
+                'label': sentiment_analysis['overall_sentiment']['primary_emotion'],
+                'score': 1.0
+            }
+        }
+    }
+
+
+def build_text_extraction_result(text):
+    return {
+        'printed_text': text.strip(),
+        'handwritten_text': '',
+        'text_regions': []
+    }
+
 
 class TextExtractionEnsemble:
-    def __init__(self):
+    def __init__(self, backend=None):
         try:
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            logger.info("Text Extraction Ensemble initialized")
+            self.backend = backend or backend_mode('TEXT_EXTRACTION_BACKEND')
+            self.model = create_model()
+            self.local_model = LazyBackend(EasyOCRTextExtractor)
+            self.local_batcher = MicroBatcher(
+                lambda images: self.local_model.get().extract_batch(images),
+                name='text-extraction-batcher',
+                **batch_settings('text_extraction')
+            )
+            self.tile_pool = ThreadPoolExecutor(max_workers=TEXT_TILE_CONCURRENCY, thread_name_prefix='ocr-tile')
+            self.preprocessor = ImagePreprocessor()
+            logger.info(f"Text Extraction Ensemble initialized ({self.backend})")
         except Exception as e:
             logger.error(f"Error initializing text extraction: {str(e)}")
             raise
 
     def extract(self, image):
         try:
+            return run_with_fallback(
+                self.backend,
+                lambda: self.local_batcher.submit(image),
+                lambda: self._extract_gemini(image),
+                lambda result: not result['printed_text'],
+                'text extraction'
+            )
+        except Exception as e:
+            logger.error(f"Error in text extraction: {str(e)}")
+            raise
+
+    def _extract_gemini(self, image):
+        try:
+            if should_tile(image):
+                return self._extract_tiled(image)
+            # Uploads may be kept large for tiling; a single call gets the usual size
+            image = self.preprocessor.downscale(image, self.preprocessor.target_size('text_extraction'))
+
             prompt = """
             Extract all text visible in this image. Format the response as follows:
             - Include only the text found in the image
@@ -30,28 +89,73 @@ class TextExtractionEnsemble:
             - Do not include any analysis or commentary
             - Return only the extracted text
             """
-            response = self.model.generate_content([prompt, image])
-            extracted_text = response.text.strip()
-            
-            return {
-                'printed_text': extracted_text,
-                'handwritten_text': '',
-                'text_regions': []
-            }
+            response = self.model.generate_content([prompt, encode_image(image)])
+            with stage('parse'):
+                return build_text_extraction_result(response.text)
         except Exception as e:
-            logger.error(f"Error in text extraction: {str(e)}")
+            logger.error(f"Gemini text extraction error: {str(e)}")
             raise
 
+    def _extract_tiled(self, image):
+        # Large pages are read as overlapping tiles in parallel, so small text survives and
+        # latency is that of the slowest tile
+        tiles = make_tiles(image.size)
+        futures = [self.tile_pool.submit(contextvars.copy_context().run, self._extract_tile, image.crop(box))
+                   for box in tiles]
+        tile_lines = [future.result() for future in futures]
+
+        with stage('parse'):
+            merged = merge_tile_lines(tiles, tile_lines)
+            result = build_text_extraction_result('\n'.join(line for line, _ in merged))
+            result['text_regions'] = [
+                {'text': line, 'box': list(tiles[index]), 'tile': index}
+                for line, index in merged
+            ]
+        logger.info(f"Tiled text extraction: {len(tiles)} tiles, {len(merged)} lines")
+        return result
+
+    def _extract_tile(self, tile):
+        prompt = """
+        This image is one tile cut from a larger page. Extract all text visible in it:
+        - Include only the text found in the image, one line of text per line
+        - Keep the reading order, top to bottom and left to right
+        - Skip words cut off at the tile edges
+        - Do not include any analysis or commentary
+        - Return only the extracted text
+        """
+        response = self.model.generate_content([prompt, encode_image(tile)])
+        return [line for line in response.text.splitlines() if line.strip()]
+
 class ImageClassificationEnsemble:
-    def __init__(self):
+    def __init__(self, backend=None):
         try:
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            logger.info("Image Classification Ensemble initialized")
+            self.backend = backend or backend_mode('CLASSIFICATION_BACKEND')
+            self.model = create_model()
+            self.local_model = LazyBackend(TransformersImageClassifier)
+            self.local_batcher = MicroBatcher(
+                lambda images: self.local_model.get().predict_batch(images),
+                name='classification-batcher',
+                **batch_settings('classification')
+            )
+            logger.info(f"Image Classification Ensemble initialized ({self.backend})")
         except Exception as e:
             logger.error(f"Error initializing image classification: {str(e)}")
             raise
 
     def predict(self, image):
+        try:
+            return run_with_fallback(
+                self.backend,
+                lambda: self.local_batcher.submit(image),
+                lambda: self._predict_gemini(image),
+                lambda result: not result['primary_subject'],
+                'classification'
+            )
+        except Exception as e:
+            logger.error(f"Error in image classification: {str(e)}")
+            raise
+
+    def _predict_gemini(self, image):
         try:
             prompt = """
             Provide a detailed classification analysis of this image. Include:
@@ -81,61 +185,46 @@ class ImageClassificationEnsemble:
             Format the response with clear section headers and bullet points.
             """
             
-            response = self.model.generate_content([prompt, image])
-            logger.info(f"Advanced classification response: {response.text}")
-            
-            # Parse the response into structured format
-            analysis = response.text.strip()
-            sections = analysis.split('\n\n')
-            
-            # Create structured output
-            classification_result = {
-                'primary_subject': [],
-                'scene_classification': [],
-                'style_composition': [],
-                'technical_details': [],
-                'additional_categories': []
-            }
-            
-            current_section = None
-            for section in sections:
-                if 'PRIMARY SUBJECT:' in section:
-                    items = section.replace('PRIMARY SUBJECT:', '').strip().split('\n')
-                    classification_result['primary_subject'] = [item.strip().replace('-', '').strip() 
-                                                             for item in items if item.strip()]
-                elif 'SCENE CLASSIFICATION:' in section:
-                    items = section.replace('SCENE CLASSIFICATION:', '').strip().split('\n')
-                    classification_result['scene_classification'] = [item.strip().replace('-', '').strip() 
-                                                                  for item in items if item.strip()]
-                elif 'STYLE & COMPOSITION:' in section:
-                    items = section.replace('STYLE & COMPOSITION:', '').strip().split('\n')
-                    classification_result['style_composition'] = [item.strip().replace('-', '').strip() 
-                                                               for item in items if item.strip()]
-                elif 'TECHNICAL DETAILS:' in section:
-                    items = section.replace('TECHNICAL DETAILS:', '').strip().split('\n')
-                    classification_result['technical_details'] = [item.strip().replace('-', '').strip() 
-                                                               for item in items if item.strip()]
-                elif 'ADDITIONAL CATEGORIES:' in section:
-                    items = section.replace('ADDITIONAL CATEGORIES:', '').strip().split('\n')
-                    classification_result['additional_categories'] = [item.strip().replace('-', '').strip() 
-                                                                   for item in items if item.strip()]
-            
-            return classification_result
+            response = self.model.generate_content([prompt, encode_image(image)])
+            log_response(logger, 'Advanced classification', response.text)
+
+            with stage('parse'):
+                return parse_classification_response(response.text)
             
         except Exception as e:
-            logger.error(f"Error in image classification: {str(e)}")
+            logger.error(f"Gemini image classification error: {str(e)}")
             raise
 
 class ObjectDetectionEnsemble:
-    def __init__(self):
+    def __init__(self, backend=None):
         try:
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            logger.info("Object Detection Ensemble initialized")
+            self.backend = backend or backend_mode('OBJECT_DETECTION_BACKEND')
+            self.model = create_model()
+            self.local_model = LazyBackend(YoloObjectDetector)
+            self.local_batcher = MicroBatcher(
+                lambda images: self.local_model.get().detect_batch(images),
+                name='object-detection-batcher',
+                **batch_settings('object_detection')
+            )
+            logger.info(f"Object Detection Ensemble initialized ({self.backend})")
         except Exception as e:
             logger.error(f"Error initializing object detection: {str(e)}")
             raise
 
     def detect(self, image):
+        try:
+            return run_with_fallback(
+                self.backend,
+                lambda: self.local_batcher.submit(image),
+                lambda: self._detect_gemini(image),
+                lambda result: not result['main_objects'],
+                'object detection'
+            )
+        except Exception as e:
+            logger.error(f"Error in object detection: {str(e)}")
+            raise
+
+    def _detect_gemini(self, image):
         try:
             prompt = """
             Analyze this image in detail and provide:
@@ -164,54 +253,20 @@ class ObjectDetectionEnsemble:
             [List distinctive features]
             """
             
-            response = self.model.generate_content([prompt, image])
-            logger.info(f"Advanced object detection response: {response.text}")
-            
-            # Parse the response into structured format
-            analysis = response.text.strip()
-            sections = analysis.split('\n\n')
-            
-            # Create structured output
-            structured_analysis = {
-                'main_objects': [],
-                'background': [],
-                'details': [],
-                'relationships': '',
-                'distinctive_features': []
-            }
-            
-            current_section = None
-            for section in sections:
-                if 'MAIN OBJECTS:' in section:
-                    current_section = 'main_objects'
-                    items = section.replace('MAIN OBJECTS:', '').strip().split('\n')
-                    structured_analysis['main_objects'] = [item.strip() for item in items if item.strip()]
-                elif 'BACKGROUND:' in section:
-                    current_section = 'background'
-                    items = section.replace('BACKGROUND:', '').strip().split('\n')
-                    structured_analysis['background'] = [item.strip() for item in items if item.strip()]
-                elif 'DETAILS:' in section:
-                    current_section = 'details'
-                    items = section.replace('DETAILS:', '').strip().split('\n')
-                    structured_analysis['details'] = [item.strip() for item in items if item.strip()]
-                elif 'RELATIONSHIPS:' in section:
-                    current_section = 'relationships'
-                    structured_analysis['relationships'] = section.replace('RELATIONSHIPS:', '').strip()
-                elif 'DISTINCTIVE FEATURES:' in section:
-                    current_section = 'distinctive_features'
-                    items = section.replace('DISTINCTIVE FEATURES:', '').strip().split('\n')
-                    structured_analysis['distinctive_features'] = [item.strip() for item in items if item.strip()]
-            
-            return structured_analysis
+            response = self.model.generate_content([prompt, encode_image(image)])
+            log_response(logger, 'Advanced object detection', response.text)
+
+            with stage('parse'):
+                return parse_object_detection_response(response.text)
             
         except Exception as e:
-            logger.error(f"Error in object detection: {str(e)}")
+            logger.error(f"Gemini object detection error: {str(e)}")
             raise
 
 class SentimentEnsemble:
     def __init__(self):
         try:
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.model = create_model()
             logger.info("Sentiment Ensemble initialized")
         except Exception as e:
             logger.error(f"Error initializing sentiment analysis: {str(e)}")
@@ -251,65 +306,84 @@ class SentimentEnsemble:
                 Format the response with clear section headers and bullet points.
                 """
             
-            response = self.model.generate_content([prompt, image] if not text else prompt)
-            analysis = response.text.strip()
-            sections = analysis.split('\n\n')
-            
-            # Create structured output
-            sentiment_analysis = {
-                'overall_sentiment': {
-                    'primary_emotion': 'NEUTRAL',
-                    'intensity': 'moderate',
-                    'confidence': '100%'
-                },
-                'emotional_components': [],
-                'contextual_analysis': [],
-                'semantic_insights': []
-            }
-            
-            # Parse sections
-            for section in sections:
-                if 'OVERALL SENTIMENT:' in section:
-                    items = section.replace('OVERALL SENTIMENT:', '').strip().split('\n')
-                    for item in items:
-                        if 'POSITIVE' in item.upper():
-                            sentiment_analysis['overall_sentiment']['primary_emotion'] = 'POSITIVE'
-                        elif 'NEGATIVE' in item.upper():
-                            sentiment_analysis['overall_sentiment']['primary_emotion'] = 'NEGATIVE'
-                        if 'intensity' in item.lower():
-                            sentiment_analysis['overall_sentiment']['intensity'] = item.split(':')[-1].strip()
-                
-                elif 'EMOTIONAL COMPONENTS:' in section:
-                    items = section.replace('EMOTIONAL COMPONENTS:', '').strip().split('\n')
-                    sentiment_analysis['emotional_components'] = [
-                        item.strip().replace('-', '').strip() 
-                        for item in items if item.strip()
-                    ]
-                
-                elif 'CONTEXTUAL ANALYSIS:' in section:
-                    items = section.replace('CONTEXTUAL ANALYSIS:', '').strip().split('\n')
-                    sentiment_analysis['contextual_analysis'] = [
-                        item.strip().replace('-', '').strip() 
-                        for item in items if item.strip()
-                    ]
-                
-                elif 'SEMANTIC INSIGHTS:' in section:
-                    items = section.replace('SEMANTIC INSIGHTS:', '').strip().split('\n')
-                    sentiment_analysis['semantic_insights'] = [
-                        item.strip().replace('-', '').strip() 
-                        for item in items if item.strip()
-                    ]
-            
-            return {
-                'ensemble_prediction': sentiment_analysis,
-                'individual_predictions': {
-                    'gemini': {
-                        'label': sentiment_analysis['overall_sentiment']['primary_emotion'],
-                        'score': 1.0
-                    }
-                }
-            }
+            response = self.model.generate_content([prompt, encode_image(image)] if not text else prompt)
+            with stage('parse'):
+                return build_sentiment_result(parse_sentiment_response(response.text))
             
         except Exception as e:
             logger.error(f"Error in sentiment analysis: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+class CombinedAnalysisEnsemble:
+    PART_PATTERN = re.compile(r'^\s*=+\s*(DESCRIPTION|CLASSIFICATION|OBJECTS|SENTIMENT|TEXT)\s*=+\s*$',
+                              re.MULTILINE)
+
+    def __init__(self):
+        try:
+            self.model = create_model()
+            logger.info("Combined Analysis Ensemble initialized")
+        except Exception as e:
+            logger.error(f"Error initializing combined analysis: {str(e)}")
+            raise
+
+    def analyze(self, image):
+        try:
+            prompt = """
+            Analyze this image once and answer in five parts. Start each part with its
+            marker line exactly as shown (for example "=== DESCRIPTION ===") and use the
+            section headers listed under each marker, each followed by bullet points.
+            Leave a blank line between sections.
+
+            === DESCRIPTION ===
+            A detailed description of the image.
+
+            === CLASSIFICATION ===
+            PRIMARY SUBJECT: main subject, category or type
+            SCENE CLASSIFICATION: setting, lighting, indoor/outdoor
+            STYLE & COMPOSITION: style, color scheme, composition type
+            TECHNICAL DETAILS: image quality, notable technical aspects
+            ADDITIONAL CATEGORIES: genre, relevant tags or keywords
+
+            === OBJECTS ===
+            MAIN OBJECTS: main subjects
+            BACKGROUND: background elements
+            DETAILS: notable details
+            RELATIONSHIPS: spatial relationships between objects
+            DISTINCTIVE FEATURES: distinctive features or patterns
+
+            === SENTIMENT ===
+            OVERALL SENTIMENT: primary emotion/mood (POSITIVE, NEGATIVE, or NEUTRAL), emotional intensity level
+            EMOTIONAL COMPONENTS: specific emotions conveyed, emotional triggers
+            CONTEXTUAL ANALYSIS: tone and atmosphere, color psychology
+            SEMANTIC INSIGHTS: emotional themes, symbolic elements, overall impact
+
+            === TEXT ===
+            All text visible in the image, blocks separated by line breaks, with no
+            commentary. Leave this part empty if the image contains no text.
+            """
+
+            response = self.model.generate_content([prompt, encode_image(image)])
+            with stage('parse'):
+                return self._build_result(response.text)
+
+        except Exception as e:
+            logger.error(f"Error in combined analysis: {str(e)}")
+            raise
+
+    def _build_result(self, text):
+        parts = self._split_parts(text)
+        return {
+            'description': parts.get('DESCRIPTION', ''),
+            'classification': parse_classification_response(parts.get('CLASSIFICATION', '')),
+            'objects': parse_object_detection_response(parts.get('OBJECTS', '')),
+            'sentiment': build_sentiment_result(parse_sentiment_response(parts.get('SENTIMENT', ''))),
+            'text': build_text_extraction_result(parts.get('TEXT', ''))
+        }
+
+    def _split_parts(self, text):
+        parts = {}
+        matches = list(self.PART_PATTERN.finditer(text))
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+            parts[match.group(1)] = text[match.end():end].strip()
+        return parts
@@ -0,0 +1,194 @@
+import io
+import json
+import logging
+import os
+import tempfile
+from collections import Counter
+from contextlib import nullcontext
+
+from PIL import Image, ImageSequence
+
+from models.preprocessing import ImageTooLargeError
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'webm', 'avi', 'mkv'}
+
+# Frames scanned per upload; anything after this is ignored
+MAX_SCANNED_FRAMES = int(os.getenv('MAX_SCANNED_FRAMES', '3000'))
+# Video frames are sampled at this rate before scene-change detection
+VIDEO_SAMPLE_FPS = float(os.getenv('VIDEO_SAMPLE_FPS', '2'))
+# Histogram distance (0-1) from the last keyframe that counts as a new scene
+KEYFRAME_THRESHOLD = float(os.getenv('KEYFRAME_THRESHOLD', '0.25'))
+MAX_KEYFRAMES = int(os.getenv('MAX_KEYFRAMES', '8'))
+FRAME_ANALYSIS_CONCURRENCY = int(os.getenv('FRAME_ANALYSIS_CONCURRENCY', '4'))
+
+HISTOGRAM_SIDE = 64
+HISTOGRAM_BINS = 32
+
+
+def extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in (filename or '') else ''
+
+
+def is_multiframe(filename, data):
+    # Videos, and GIFs with more than one frame
+    ext = extension(filename)
+    if ext in VIDEO_EXTENSIONS:
+        return True
+    if ext != 'gif':
+        return False
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return getattr(image, 'n_frames', 1) > 1
+    except Exception:
+        return False
+
+
+def iter_frames(filename, data, max_frames=MAX_SCANNED_FRAMES, max_pixels=None, decode_slot=None):
+    # Yields (frame index, timestamp in ms, RGB image) one frame at a time. Frames larger
+    # than max_pixels are rejected from the header, before any of them is decoded. Each
+    # frame is decoded inside decode_slot(size) (e.g. ImagePreprocessor.decode_slot),
+    # which stays held while the consumer works on the yielded frame.
+    decode_slot = decode_slot or (lambda size: nullcontext())
+    if extension(filename) in VIDEO_EXTENSIONS:
+        yield from _iter_video_frames(data, extension(filename), max_frames, max_pixels, decode_slot)
+    else:
+        yield from _iter_gif_frames(data, max_frames, max_pixels, decode_slot)
+
+
+def _check_frame_size(width, height, max_pixels):
+    if max_pixels is not None and width * height > max_pixels:
+        raise ImageTooLargeError(f"Frames of {width}x{height} pixels exceed {max_pixels} pixels")
+
+
+def _iter_gif_frames(data, max_frames, max_pixels, decode_slot):
+    timestamp = 0
+    with Image.open(io.BytesIO(data)) as image:
+        _check_frame_size(*image.size, max_pixels)
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            if index >= max_frames:
+                break
+            _check_frame_size(*frame.size, max_pixels)
+            # GIF frames are deltas, so every frame is decoded even when not kept
+            with decode_slot(frame.size):
+                yield index, timestamp, frame.convert('RGB')
+            timestamp += frame.info.get('duration', 0) or 0
+
+
+def _iter_video_frames(data, ext, max_frames, max_pixels, decode_slot, sample_fps=VIDEO_SAMPLE_FPS):
+    import cv2
+
+    # OpenCV only reads from a path
+    with tempfile.NamedTemporaryFile(suffix=f'.{ext}', delete=False) as f:
+        f.write(data)
+        path = f.name
+
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError("Unable to read video")
+        size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        _check_frame_size(*size, max_pixels)
+
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        stride = max(1, round(fps / sample_fps)) if sample_fps > 0 else 1
+        index = 0
+        while index < max_frames * stride:
+            # grab() skips a frame without decoding it into an image
+            if not capture.grab():
+                break
+            if index % stride == 0:
+                with decode_slot(size):
+                    ok, frame = capture.retrieve()
+                    if not ok:
+                        break
+                    _check_frame_size(frame.shape[1], frame.shape[0], max_pixels)
+                    yield index, round(index * 1000 / fps), Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            index += 1
+    finally:
+        capture.release()
+        os.unlink(path)
+
+
+def frame_histogram(image):
+    # Normalized per-channel colour histogram of a small thumbnail
+    import numpy as np
+
+    pixels = np.asarray(image.resize((HISTOGRAM_SIDE, HISTOGRAM_SIDE), Image.Resampling.BOX))
+    shift = 8 - (HISTOGRAM_BINS.bit_length() - 1)
+    histogram = np.stack([
+        np.bincount((pixels[..., channel] >> shift).ravel(), minlength=HISTOGRAM_BINS)
+        for channel in range(3)
+    ]).astype(np.float32)
+    return histogram / (HISTOGRAM_SIDE * HISTOGRAM_SIDE)
+
+
+def histogram_distance(a, b):
+    # Total variation distance averaged over the channels: 0 for identical, 1 for disjoint
+    return float(abs(a - b).sum()) / 6
+
+
+def select_keyframes(frames, threshold=KEYFRAME_THRESHOLD, max_keyframes=MAX_KEYFRAMES, prepare=None):
+    # Keeps the first frame and every frame that differs from the last keyframe by more than
+    # threshold. Past max_keyframes the least distinct scene change is dropped, so at most
+    # max_keyframes + 1 images are held. prepare (e.g. a downscale) is applied to kept frames.
+    # Returns (keyframes as [(index, timestamp_ms, image)], frames scanned).
+    keyframes = []
+    reference = None
+    scanned = 0
+
+    for index, timestamp, image in frames:
+        scanned += 1
+        histogram = frame_histogram(image)
+        if reference is None:
+            score = 1.0
+        else:
+            score = histogram_distance(histogram, reference)
+            if score <= threshold:
+                continue
+
+        reference = histogram
+        keyframes.append((score, index, timestamp, prepare(image) if prepare else image))
+        if len(keyframes) > max_keyframes:
+            weakest = min(range(1, len(keyframes)), key=lambda i: keyframes[i][0])
+            del keyframes[weakest]
+
+    return [(index, timestamp, image) for _, index, timestamp, image in keyframes], scanned
+
+
+def aggregate_results(analyses):
+    # Merges per-frame analyses: lists become their ordered union, multi-line text the
+    # union of its lines, and single values the most common one across frames
+    analyses = [analysis for analysis in analyses if analysis is not None]
+    if not analyses:
+        return {}
+    return _merge(analyses)
+
+
+def _merge(values):
+    first = values[0]
+    if isinstance(first, dict):
+        keys = []
+        for value in values:
+            keys.extend(key for key in value if key not in keys)
+        return {key: _merge([value[key] for value in values if key in value]) for key in keys}
+
+    if isinstance(first, list):
+        # Ordered union; dict items (e.g. text regions) are compared by their JSON form
+        merged, seen = [], set()
+        for value in values:
+            for item in value:
+                key = json.dumps(item, sort_keys=True, default=str) if isinstance(item, (dict, list)) else item
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(item)
+        return merged
+
+    if isinstance(first, str) and any('\n' in value for value in values):
+        lines = []
+        for value in values:
+            lines.extend(line for line in value.splitlines() if line.strip() and line not in lines)
+        return '\n'.join(lines)
+
+    return Counter(values).most_common(1)[0][0]
@@ -0,0 +1,262 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from models.metrics import GEMINI_CALLS, stage
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+
+# Optional transport/endpoint overrides, e.g. GEMINI_TRANSPORT=rest with a local fake API endpoint
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT')
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+
+# Shared quota and resilience settings for every Gemini call in the process
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '1000'))
+GEMINI_BURST = int(os.getenv('GEMINI_BURST', '20'))
+GEMINI_RATE_LIMIT_WAIT = float(os.getenv('GEMINI_RATE_LIMIT_WAIT', '10'))
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '32'))
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '60'))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '4'))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', '0.5'))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv('GEMINI_RETRY_MAX_DELAY', '16'))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+GEMINI_BREAKER_RESET = float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+_configure_lock = threading.Lock()
+_configured = False
+
+
+class GeminiUnavailableError(RuntimeError):
+    # Raised instead of calling Gemini when the quota or the circuit breaker says no
+    pass
+
+
+class CircuitOpenError(GeminiUnavailableError):
+    pass
+
+
+def configure_gemini():
+    # Import and configure the SDK once per process, on first use
+    global _configured
+    import google.generativeai as genai
+
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                from dotenv import load_dotenv
+
+                load_dotenv()
+                options = {'api_key': os.getenv("GOOGLE_API_KEY")}
+                if GEMINI_TRANSPORT:
+                    options['transport'] = GEMINI_TRANSPORT
+                if GEMINI_API_ENDPOINT:
+                    options['client_options'] = {'api_endpoint': GEMINI_API_ENDPOINT}
+                genai.configure(**options)
+                _configured = True
+    return genai
+
+
+def is_retryable(error):
+    code = getattr(error, 'code', None)
+    if callable(code):
+        code = code()
+    try:
+        return int(code) in RETRYABLE_STATUS_CODES
+    except (TypeError, ValueError):
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        # Returns False if no token became available within timeout seconds
+        if self.rate <= 0:
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    # closed -> open after `threshold` consecutive failures; one trial call after `reset_timeout`
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release(self):
+        # The call neither proved nor disproved upstream health (e.g. a 400 for a bad prompt):
+        # free the half-open trial slot and leave the state as it is
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == 'half_open' or self._failures >= self.threshold:
+                if self.state != 'open':
+                    logger.warning(f"Gemini circuit breaker opened after {self._failures} failures")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class GeminiClient:
+    def __init__(self, model_factory=None, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                 burst=GEMINI_BURST, rate_limit_wait=GEMINI_RATE_LIMIT_WAIT,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY, timeout=GEMINI_TIMEOUT,
+                 max_retries=GEMINI_MAX_RETRIES, retry_base_delay=GEMINI_RETRY_BASE_DELAY,
+                 retry_max_delay=GEMINI_RETRY_MAX_DELAY, breaker_threshold=GEMINI_BREAKER_THRESHOLD,
+                 breaker_reset=GEMINI_BREAKER_RESET):
+        # model_factory(name) returns an object with generate_content(); defaults to the real SDK
+        self.model_factory = model_factory or (lambda name: configure_gemini().GenerativeModel(name))
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0, burst)
+        self.rate_limit_wait = rate_limit_wait
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._models = {}
+        self._models_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+
+    def model(self, model_name):
+        # One SDK model (and underlying connection) per model name, shared by every caller
+        with self._models_lock:
+            if model_name not in self._models:
+                self._models[model_name] = self.model_factory(model_name)
+            return self._models[model_name]
+
+    def generate_content(self, contents, model_name=GEMINI_MODEL_NAME, timeout=None, **kwargs):
+        model = self.model(model_name)
+        kwargs.setdefault('request_options', {'timeout': timeout or self.timeout})
+
+        attempt = 0
+        while True:
+            if not self.rate_limiter.acquire(timeout=self.rate_limit_wait):
+                self._count('rejected')
+                GEMINI_CALLS.inc(outcome='rate_limited')
+                raise GeminiUnavailableError("Gemini request quota exhausted, try again later")
+            if not self.breaker.allow():
+                self._count('rejected')
+                GEMINI_CALLS.inc(outcome='circuit_open')
+                raise CircuitOpenError("Gemini is unavailable (circuit open), try again later")
+
+            self._count('calls')
+            try:
+                with self._semaphore, stage('gemini_call'):
+                    response = model.generate_content(contents, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                GEMINI_CALLS.inc(outcome='retryable_error' if retryable else 'error')
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+
+                if not retryable or attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+                attempt += 1
+                self._count('retries')
+                logger.warning(f"Gemini call failed ({str(e)}), retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            GEMINI_CALLS.inc(outcome='ok')
+            return response
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['circuit'] = self.breaker.state
+        return stats
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+
+class GeminiModel:
+    # Drop-in for genai.GenerativeModel that routes through the process-wide client
+    def __init__(self, model_name=GEMINI_MODEL_NAME):
+        self.model_name = model_name
+
+    def generate_content(self, contents, **kwargs):
+        return get_client().generate_content(contents, model_name=self.model_name, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient()
+    return _client
+
+
+def set_client(client):
+    # Swap the shared client, e.g. for one backed by a local fake model
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def create_model(model_name=GEMINI_MODEL_NAME):
+    return GeminiModel(model_name)
@@ -0,0 +1,18 @@
+import os
+import time
+
+# Crockford base32, as used by ULIDs
+ENCODING = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def new_id():
+    # 26-character ULID: 48-bit millisecond timestamp followed by 80 random bits.
+    # IDs sort by creation time (to the millisecond) and do not collide across workers.
+    timestamp = int(time.time() * 1000) & ((1 << 48) - 1)
+    value = (timestamp << 80) | int.from_bytes(os.urandom(10), 'big')
+
+    chars = []
+    for _ in range(26):
+        chars.append(ENCODING[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
@@ -0,0 +1,67 @@
+import atexit
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from models.storage import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+PERSIST_MODES = ('sync', 'async', 'none')
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class UploadStore:
+    def __init__(self, upload_folder, persist_mode='sync', max_workers=2):
+        if persist_mode not in PERSIST_MODES:
+            raise ValueError(f"Invalid upload persist mode: {persist_mode}")
+
+        self.upload_folder = upload_folder
+        self.persist_mode = persist_mode
+        self._executor = None
+        if persist_mode == 'async':
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload')
+            atexit.register(self.close)
+
+        os.makedirs(upload_folder, exist_ok=True)
+
+    def persist(self, filename, data):
+        # Returns the stored filename, or None when uploads are not kept on disk
+        if self.persist_mode == 'none':
+            return None
+
+        if self.persist_mode == 'async':
+            self._executor.submit(self._write, filename, data)
+        else:
+            self._write(filename, data)
+        return filename
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _write(self, filename, data):
+        try:
+            atomic_write_bytes(os.path.join(self.upload_folder, filename), data)
+        except Exception as e:
+            logger.error(f"Failed to persist upload {filename}: {str(e)}")
+            if self.persist_mode == 'sync':
+                raise
+
+
+def read_upload(file_storage, max_bytes=None):
+    # Read the whole upload into memory so it can be decoded without touching disk,
+    # giving up as soon as it grows past max_bytes
+    buffer = io.BytesIO()
+    while True:
+        chunk = file_storage.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.write(chunk)
+        if max_bytes is not None and buffer.tell() > max_bytes:
+            raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+    return buffer.getvalue()
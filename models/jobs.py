@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.partial_text = ''
+        self.created_at = time.time()
+        self.finished_at = None
+        self._events = []
+        self._condition = threading.Condition()
+
+    def publish(self, event, data):
+        with self._condition:
+            if event == 'partial':
+                self.partial_text += data.get('text', '')
+            self._events.append((event, data))
+            self._condition.notify_all()
+
+    def events(self, start=0, timeout=15):
+        # Yields (index, event, data); yields (index, None, None) as a keep-alive on timeout
+        index = start
+        while True:
+            with self._condition:
+                if index >= len(self._events) and not self.finished:
+                    self._condition.wait(timeout)
+                pending = self._events[index:]
+                finished = self.finished
+
+            if not pending:
+                if finished:
+                    return
+                yield index, None, None
+                continue
+
+            for event, data in pending:
+                yield index, event, data
+                index += 1
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        job = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+        if self.status == 'completed':
+            job['result'] = self.result
+        elif self.status == 'failed':
+            job['error'] = self.error
+        elif self.partial_text:
+            job['partial_text'] = self.partial_text
+        return job
+
+    def _finish(self, status, result=None, error=None):
+        with self._condition:
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self._events.append(('result' if status == 'completed' else 'error',
+                                 result if status == 'completed' else {'error': error}))
+            self.status = status
+            self._condition.notify_all()
+
+
+class JobManager:
+    def __init__(self, max_workers=64, ttl_seconds=3600, max_jobs=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, fn, *args, **kwargs):
+        # fn receives the Job as its first argument so it can publish partial results
+        self._expire()
+        job = Job(uuid.uuid4().hex)
+        with self._lock:
+            if len(self._jobs) >= self.max_jobs:
+                raise RuntimeError("Too many jobs in flight")
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        stats = {'total': len(jobs)}
+        for status in ('queued', 'running', 'completed', 'failed'):
+            stats[status] = sum(1 for job in jobs if job.status == status)
+        return stats
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        try:
+            result = fn(job, *args, **kwargs)
+            job._finish('completed', result=result)
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {str(e)}")
+            job._finish('failed', error=str(e))
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('timestamp', 'query_type', 'image_path', 'status', 'trained_at')
+
+
+class MetadataStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connection(self):
+        # sqlite3 connections are per thread; WAL lets readers and the writer proceed concurrently
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        # Autocommit mode (isolation_level=None) makes `with connection:` a no-op, so
+        # multi-row writes open their own transaction to stay atomic and avoid a commit per row
+        connection = self._connection()
+        connection.execute('BEGIN')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS samples (
+                sample_id TEXT PRIMARY KEY,
+                timestamp TEXT,
+                query_type TEXT,
+                image_path TEXT,
+                status TEXT,
+                trained_at TEXT,
+                extra TEXT
+            )
+        """)
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_samples_status ON samples (status, query_type)')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_samples_query_type ON samples (query_type)')
+
+    def add(self, sample_id, info):
+        self.add_many([(sample_id, info)])
+
+    def add_many(self, samples):
+        rows = [self._to_row(sample_id, info) for sample_id, info in samples]
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO samples '
+                '(sample_id, timestamp, query_type, image_path, status, trained_at, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def get(self, sample_id):
+        row = self._connection().execute(
+            'SELECT * FROM samples WHERE sample_id = ?', (sample_id,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def find(self, status=None, query_type=None):
+        # Yields (sample_id, info) in insertion order
+        query, params = self._where('SELECT * FROM samples', status, query_type)
+        for row in self._connection().execute(query + ' ORDER BY rowid', params):
+            yield row['sample_id'], self._from_row(row)
+
+    def find_after(self, rowid, status=None, query_type=None):
+        # Yields (rowid, sample_id, info) for samples added after the given rowid
+        query, params = self._where('SELECT rowid, * FROM samples', status, query_type,
+                                    clauses=['rowid > ?'], params=[rowid])
+        for row in self._connection().execute(query + ' ORDER BY rowid', params):
+            yield row['rowid'], row['sample_id'], self._from_row(row)
+
+    def count(self, status=None, query_type=None):
+        query, params = self._where('SELECT COUNT(*) FROM samples', status, query_type)
+        return self._connection().execute(query, params).fetchone()[0]
+
+    def update_status(self, status, trained_at=None, sample_ids=None, from_status=None):
+        with self._transaction() as connection:
+            if sample_ids is None:
+                query, params = self._where('UPDATE samples SET status = ?, trained_at = ?', from_status, None)
+                return connection.execute(query, [status, trained_at] + params).rowcount
+
+            query = 'UPDATE samples SET status = ?, trained_at = ? WHERE sample_id = ?'
+            if from_status is not None:
+                query += ' AND status = ?'
+            rows = [(status, trained_at, sample_id) + ((from_status,) if from_status is not None else ())
+                    for sample_id in sample_ids]
+            return connection.executemany(query, rows).rowcount
+
+    def migrate_from_json(self, json_path):
+        # One-off import of the legacy metadata.json; the file is renamed so it is not re-read
+        if not os.path.exists(json_path):
+            return 0
+
+        with open(json_path, 'r') as f:
+            metadata = json.load(f)
+
+        self.add_many(metadata.items())
+        os.replace(json_path, f"{json_path}.migrated")
+        logger.info(f"Migrated {len(metadata)} samples from {json_path} to {self.db_path}")
+        return len(metadata)
+
+    def _where(self, query, status, query_type, clauses=None, params=None):
+        clauses, params = list(clauses or []), list(params or [])
+        if status is not None:
+            clauses.append('status = ?')
+            params.append(status)
+        if query_type is not None:
+            clauses.append('query_type = ?')
+            params.append(query_type)
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        return query, params
+
+    def _to_row(self, sample_id, info):
+        extra = {key: value for key, value in info.items() if key not in COLUMNS}
+        return (sample_id,) + tuple(info.get(column) for column in COLUMNS) + \
+            (json.dumps(extra) if extra else None,)
+
+    def _from_row(self, row):
+        info = {column: row[column] for column in COLUMNS if row[column] is not None}
+        if row['extra']:
+            info.update(json.loads(row['extra']))
+        return info
@@ -0,0 +1,212 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEMORY_BUCKETS = tuple(2 ** power for power in range(20, 32))
+
+# Fraction of model responses written to the debug log (only when DEBUG is enabled)
+RESPONSE_LOG_SAMPLE_RATE = float(os.getenv('RESPONSE_LOG_SAMPLE_RATE', '0.01'))
+
+# Query type of the request being served, so deep call sites can label their timings
+_query_type = contextvars.ContextVar('query_type', default='none')
+# Memory accounted to the request being served
+_request_memory = contextvars.ContextVar('request_memory', default=None)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(label, '') for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(label, '') for label in self.labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def totals(self):
+        # {label values: (sum, count)}, e.g. for diffing two points in time
+        with self._lock:
+            return {key: (total, count) for key, (_, total, count) in self._values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket"
+                                 f"{_format_labels(self.labels + ('le',), key + (repr(bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+REQUEST_SECONDS = Histogram('imageiq_request_seconds', 'HTTP request latency',
+                            ('endpoint', 'method', 'status'))
+STAGE_SECONDS = Histogram('imageiq_stage_seconds', 'Time spent in each request stage',
+                          ('stage', 'query_type'))
+STAGE_ERRORS = Counter('imageiq_stage_errors_total', 'Exceptions raised by each request stage',
+                       ('stage', 'query_type'))
+ANALYSES = Counter('imageiq_analyses_total', 'Analyses served, by result source',
+                   ('query_type', 'source'))
+GEMINI_CALLS = Counter('imageiq_gemini_calls_total', 'Gemini API attempts, by outcome', ('outcome',))
+REQUEST_MEMORY_BYTES = Histogram('imageiq_request_peak_memory_bytes',
+                                 'Peak upload and image buffer memory held by a request',
+                                 ('endpoint',), buckets=MEMORY_BUCKETS)
+
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, STAGE_ERRORS, ANALYSES, GEMINI_CALLS, REQUEST_MEMORY_BYTES]
+
+
+def set_query_type(query_type):
+    # Returns a token for reset_query_type()
+    return _query_type.set(query_type)
+
+
+def reset_query_type(token):
+    _query_type.reset(token)
+
+
+@contextmanager
+def query_type_context(query_type):
+    # Context variables do not follow work handed to other threads, so pool workers set it again
+    token = set_query_type(query_type)
+    try:
+        yield
+    finally:
+        reset_query_type(token)
+
+
+@contextmanager
+def stage(name):
+    # Times a block into imageiq_stage_seconds and counts it in imageiq_stage_errors_total if it raises
+    query_type = _query_type.get()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name, query_type=query_type)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name, query_type=query_type)
+
+
+class MemoryTracker:
+    # Running total and peak of the large buffers (uploads, decoded images) a request holds.
+    # Process RSS is shared by every thread, so this is what tells requests apart.
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def add(self, nbytes):
+        with self._lock:
+            self.current += nbytes
+            self.peak = max(self.peak, self.current)
+
+    def release(self, nbytes):
+        with self._lock:
+            self.current -= nbytes
+
+
+def start_memory_tracking():
+    # Returns a token for finish_memory_tracking()
+    return _request_memory.set(MemoryTracker())
+
+
+def finish_memory_tracking(token):
+    # Returns the request's peak in bytes
+    tracker = _request_memory.get()
+    _request_memory.reset(token)
+    return tracker.peak if tracker is not None else 0
+
+
+def memory_tracker():
+    # The current request's tracker (or None), for work that outlives the request context
+    return _request_memory.get()
+
+
+def account_memory(nbytes):
+    # Memory held until the end of the request
+    tracker = _request_memory.get()
+    if tracker is not None:
+        tracker.add(nbytes)
+
+
+@contextmanager
+def reserve_memory(nbytes):
+    # Memory held only for the duration of the block
+    tracker = _request_memory.get()
+    if tracker is None:
+        yield
+        return
+    tracker.add(nbytes)
+    try:
+        yield
+    finally:
+        tracker.release(nbytes)
+
+
+def log_response(log, name, text):
+    # Model responses are large; only a sample of them is logged, and only at debug level
+    if log.isEnabledFor(logging.DEBUG) and random.random() < RESPONSE_LOG_SAMPLE_RATE:
+        log.debug(f"{name} response: {text}")
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
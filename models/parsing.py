@@ -0,0 +1,115 @@
+import re
+
+BULLETS = '-*•+'
+# Numbered list markers, "1." or "1)" followed by whitespace
+NUMBERED_PATTERN = re.compile(r'\d+[.)]\s+')
+
+
+class SectionParser:
+    # Splits a model response into named sections in a single pass over its lines.
+    # sections is a list of (key, header names, kind) where kind is 'list' (one item per
+    # line) or 'text' (lines joined with newlines). A header line may carry markdown
+    # (#, **, numbering) and inline content after its colon; header matching ignores case.
+    def __init__(self, sections):
+        self.sections = sections
+        self._keys = {}
+        for key, headers, _ in sections:
+            for header in headers:
+                self._keys[header.upper()] = key
+
+        names = '|'.join(re.escape(header) for header in sorted(self._keys, key=len, reverse=True))
+        self._header_match = re.compile(
+            r'(?:#+\s*)?(?:\*\*|__)?\s*(?:\d+[.)]\s*)?(?:\*\*|__)?\s*'
+            rf'(?P<header>{names})\b\s*(?:\*\*|__)?\s*(?P<colon>:)?\s*(?:\*\*|__)?\s*(?P<rest>.*)',
+            re.IGNORECASE
+        ).match
+
+    def parse(self, text):
+        found = {key: [] for key, _, _ in self.sections}
+        current = None
+        header_match = self._header_match
+
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+
+            # Bulleted lines are items; only the remaining lines can be headers
+            first = line[0]
+            if first in BULLETS and line[1:2] in (' ', '\t'):
+                if current is not None:
+                    current.append(line[2:].lstrip())
+                continue
+
+            match = header_match(line)
+            # A header is alone on its line or followed by a colon
+            if match and (match.group('colon') or not match.group('rest')):
+                current = found[self._keys[match.group('header').upper()]]
+                line = match.group('rest')
+                if not line:
+                    continue
+            elif current is None:
+                continue
+
+            if first.isdigit():
+                line = NUMBERED_PATTERN.sub('', line, count=1)
+            current.append(line)
+
+        return {key: '\n'.join(found[key]) if kind == 'text' else found[key]
+                for key, _, kind in self.sections}
+
+
+CLASSIFICATION_PARSER = SectionParser([
+    ('primary_subject', ('PRIMARY SUBJECT',), 'list'),
+    ('scene_classification', ('SCENE CLASSIFICATION',), 'list'),
+    ('style_composition', ('STYLE & COMPOSITION', 'STYLE AND COMPOSITION'), 'list'),
+    ('technical_details', ('TECHNICAL DETAILS',), 'list'),
+    ('additional_categories', ('ADDITIONAL CATEGORIES',), 'list'),
+])
+
+OBJECT_DETECTION_PARSER = SectionParser([
+    ('main_objects', ('MAIN OBJECTS',), 'list'),
+    ('background', ('BACKGROUND',), 'list'),
+    ('details', ('DETAILS',), 'list'),
+    ('relationships', ('RELATIONSHIPS',), 'text'),
+    ('distinctive_features', ('DISTINCTIVE FEATURES',), 'list'),
+])
+
+SENTIMENT_PARSER = SectionParser([
+    ('overall_sentiment', ('OVERALL SENTIMENT',), 'list'),
+    ('emotional_components', ('EMOTIONAL COMPONENTS',), 'list'),
+    ('contextual_analysis', ('CONTEXTUAL ANALYSIS',), 'list'),
+    ('semantic_insights', ('SEMANTIC INSIGHTS',), 'list'),
+])
+
+
+
+def parse_classification_response(text):
+    return CLASSIFICATION_PARSER.parse(text)
+
+
+def parse_object_detection_response(text):
+    return OBJECT_DETECTION_PARSER.parse(text)
+
+
+def parse_sentiment_response(text):
+    sections = SENTIMENT_PARSER.parse(text)
+
+    overall = {
+        'primary_emotion': 'NEUTRAL',
+        'intensity': 'moderate',
+        'confidence': '100%'
+    }
+    for item in sections['overall_sentiment']:
+        # Within an item POSITIVE beats NEGATIVE ("positive, no negative undertones");
+        # across items the last one mentioning either wins. NEUTRAL is the default.
+        upper = item.upper()
+        if 'POSITIVE' in upper:
+            overall['primary_emotion'] = 'POSITIVE'
+        elif 'NEGATIVE' in upper:
+            overall['primary_emotion'] = 'NEGATIVE'
+        if 'INTENSITY' in upper:
+            overall['intensity'] = item.split(':')[-1].strip()
+
+    sections['overall_sentiment'] = overall
+    return sections
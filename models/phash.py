@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+HASH_SIZE = 8
+# Mean colour is bucketed to 3 bits per channel so flat or low-detail images of
+# different colours (which all share a dHash of ~0) never match each other
+COLOR_SHIFT = 5
+
+
+def fingerprint(image, hash_size=HASH_SIZE):
+    # (colour bucket, dHash): the dHash has one bit per horizontally adjacent pixel pair
+    # of a (hash_size + 1) x hash_size grayscale thumbnail, set when brightness increases
+    import numpy as np
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    pixels = np.asarray(image.resize((hash_size + 1, hash_size), Image.Resampling.BOX), dtype=np.float32)
+
+    gray = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    bits = np.packbits(gray[:, 1:] > gray[:, :-1])
+    dhash = int.from_bytes(bits.tobytes(), 'big')
+
+    red, green, blue = (int(value) >> COLOR_SHIFT for value in pixels.reshape(-1, 3).mean(axis=0))
+    return (red << 6) | (green << 3) | blue, dhash
+
+
+def fingerprint_file(source, hash_size=HASH_SIZE):
+    # Fingerprint of an image file or file object, decoding JPEGs at reduced scale
+    with Image.open(source) as image:
+        image.draft('RGB', (hash_size * 8, hash_size * 8))
+        return fingerprint(image, hash_size)
+
+
+def format_fingerprint(value):
+    color, dhash = value
+    return f"{color:03x}{dhash:016x}"
+
+
+def parse_fingerprint(text):
+    return int(text[:3], 16), int(text[3:], 16)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    # Metric tree over hamming distance: only children whose edge distance lies within
+    # [d - max_distance, d + max_distance] of the query's distance d can hold a match
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key, value):
+        node = [key, value, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+
+        current = self._root
+        while True:
+            distance = hamming(key, current[0])
+            if distance == 0:
+                # Same hash: keep the newer value
+                current[1] = value
+                self._size -= 1
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def find(self, key, max_distance):
+        # Returns (distance, value) of the closest entry within max_distance, or None
+        if self._root is None:
+            return None
+
+        best = None
+        stack = [self._root]
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, value)
+                if distance == 0:
+                    break
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return best
+
+
+class NearDuplicateIndex:
+    # Bounded fingerprint -> value index; the oldest half is dropped when it fills up
+    def __init__(self, max_distance=5, max_entries=10000):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._trees = {}
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'matches': 0}
+
+    def add(self, value_fingerprint, value):
+        with self._lock:
+            self._entries[value_fingerprint] = value
+            self._entries.move_to_end(value_fingerprint)
+            if len(self._entries) > self.max_entries:
+                for _ in range(len(self._entries) - self.max_entries // 2):
+                    self._entries.popitem(last=False)
+                self._rebuild()
+            else:
+                color, dhash = value_fingerprint
+                self._trees.setdefault(color, BKTree()).add(dhash, value)
+
+    def find(self, value_fingerprint):
+        color, dhash = value_fingerprint
+        with self._lock:
+            self._stats['lookups'] += 1
+            tree = self._trees.get(color)
+            match = tree.find(dhash, self.max_distance) if tree is not None else None
+            if match is not None:
+                self._stats['matches'] += 1
+                return match[1]
+            return None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['max_distance'] = self.max_distance
+        return stats
+
+    def _rebuild(self):
+        # Caller must hold the lock
+        self._trees = {}
+        for (color, dhash), value in self._entries.items():
+            self._trees.setdefault(color, BKTree()).add(dhash, value)
@@ -0,0 +1,131 @@
+import io
+import logging
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+
+from models.metrics import account_memory, reserve_memory, stage
+
+logger = logging.getLogger(__name__)
+
+# Longest side (in pixels) of the image handed to the models for each query type
+DEFAULT_TARGET_SIZES = {
+    'general': 1536,
+    'classification': 768,
+    'object_detection': 1024,
+    'sentiment': 768,
+    'text_extraction': 3072,
+    'all': 1536
+}
+# Hard cap on any target size; only tiled text extraction goes above FALLBACK_TARGET_SIZE by default
+MAX_TARGET_SIZE = 8192
+FALLBACK_TARGET_SIZE = 4096
+
+# Largest image decoded, in pixels after any JPEG draft scaling; also Pillow's own
+# decompression bomb limit, which rejects anything declaring more than twice this
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(64 * 1024 * 1024)))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+# Full decodes running at once per process; each can hold up to MAX_IMAGE_PIXELS * 4 bytes
+DECODE_CONCURRENCY = int(os.getenv('DECODE_CONCURRENCY', str(os.cpu_count() or 4)))
+
+# Encoding used when sending images to Gemini
+UPLOAD_IMAGE_FORMAT = os.getenv('GEMINI_IMAGE_FORMAT', 'JPEG').upper()
+UPLOAD_IMAGE_QUALITY = int(os.getenv('GEMINI_IMAGE_QUALITY', '85'))
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+class ImagePreprocessor:
+    def __init__(self, target_sizes=None, default_size=FALLBACK_TARGET_SIZE,
+                 max_pixels=MAX_IMAGE_PIXELS, decode_concurrency=DECODE_CONCURRENCY):
+        self.target_sizes = dict(DEFAULT_TARGET_SIZES)
+        if target_sizes:
+            self.target_sizes.update(target_sizes)
+        self.default_size = default_size
+        self.max_pixels = max_pixels
+        self._decode_slots = threading.BoundedSemaphore(decode_concurrency)
+
+    def target_size(self, query_type):
+        return min(self.target_sizes.get(query_type, self.default_size), MAX_TARGET_SIZE)
+
+    def check_size(self, size):
+        if size[0] * size[1] > self.max_pixels:
+            raise ImageTooLargeError(f"Image of {size[0]}x{size[1]} pixels exceeds {self.max_pixels} pixels")
+
+    def load(self, data, query_type):
+        # Decode and downscale in one go, preserving aspect ratio. Only the header is read
+        # before the size check; the full decode waits for a free decode slot.
+        try:
+            image = Image.open(io.BytesIO(data))
+        except Image.DecompressionBombError as e:
+            raise ImageTooLargeError(str(e))
+
+        target = self.target_size(query_type)
+        requested = self._scaled_size(image.size, target)
+        if requested != image.size and image.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers the target
+            image.draft('RGB', requested)
+
+        with self.decode_slot(image.size):
+            with stage('decode'):
+                image = image.convert('RGB')
+            with stage('resize'):
+                image = self.downscale(image, target)
+
+        account_memory(image.size[0] * image.size[1] * 4)
+        return image
+
+    @contextmanager
+    def decode_slot(self, size):
+        # Checks the size, waits for a free decode slot and accounts the decoded buffer
+        # (Pillow keeps RGB pixels in 4 bytes) to the request for the duration of the block
+        self.check_size(size)
+        with stage('decode_wait'):
+            self._decode_slots.acquire()
+        try:
+            with reserve_memory(size[0] * size[1] * 4):
+                yield
+        finally:
+            self._decode_slots.release()
+
+    def downscale(self, image, target):
+        requested = self._scaled_size(image.size, target)
+        if requested == image.size:
+            return image
+
+        # Cheap box reduction by an integer factor first, then a single filtered resize
+        factor = min(image.size[0] // requested[0], image.size[1] // requested[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        if image.size != requested:
+            image = image.resize(requested, Image.Resampling.BICUBIC)
+        return image
+
+    def _scaled_size(self, size, target):
+        width, height = size
+        longest = max(width, height)
+        if longest <= target:
+            return size
+        scale = target / longest
+        return max(1, math.ceil(width * scale - 0.5)), max(1, math.ceil(height * scale - 0.5))
+
+
+def encode_image(image, image_format=UPLOAD_IMAGE_FORMAT, quality=UPLOAD_IMAGE_QUALITY):
+    # Compact lossy blob for upload; without this the SDK sends lossless WebP
+    if not isinstance(image, Image.Image):
+        return image
+
+    buffer = io.BytesIO()
+    with stage('encode'):
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buffer, format=image_format, quality=quality)
+    return {
+        'mime_type': Image.MIME.get(image_format, f'image/{image_format.lower()}'),
+        'data': buffer.getvalue()
+    }
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import struct
+from array import array
+from models.metadata_store import MetadataStore
+from models.storage import atomic_write_bytes, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Each record is a little-endian (header length, image length) pair followed by a JSON
+# header and the raw image bytes. The .idx file holds one uint64 offset per record.
+RECORD_HEADER = struct.Struct('<II')
+MANIFEST = 'manifest.json'
+
+
+def load_manifest(shard_dir):
+    try:
+        with open(os.path.join(shard_dir, MANIFEST), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'shards': [], 'last_rowid': 0}
+
+
+class ShardWriter:
+    def __init__(self, shard_dir, records_per_shard=4096):
+        self.shard_dir = shard_dir
+        self.records_per_shard = records_per_shard
+        self.manifest = load_manifest(shard_dir)
+        self._file = None
+        self._offsets = None
+        self._current = None
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def write(self, rowid, header, image_bytes=b''):
+        if self._file is None:
+            self._open_shard()
+
+        encoded = json.dumps(header).encode('utf-8')
+        self._offsets.append(self._file.tell())
+        self._file.write(RECORD_HEADER.pack(len(encoded), len(image_bytes)))
+        self._file.write(encoded)
+        self._file.write(image_bytes)
+
+        self._current['count'] += 1
+        self._current['first_rowid'] = self._current['first_rowid'] or rowid
+        self._current['last_rowid'] = rowid
+        self.manifest['last_rowid'] = rowid
+
+        if self._current['count'] >= self.records_per_shard:
+            self._close_shard()
+
+    def close(self):
+        self._close_shard()
+        # Shards only become visible to readers once listed in the manifest
+        atomic_write_json(os.path.join(self.shard_dir, MANIFEST), self.manifest, indent=4)
+
+    def _open_shard(self):
+        name = f"shard-{len(self.manifest['shards']):06d}"
+        self._current = {'name': name, 'count': 0, 'first_rowid': 0, 'last_rowid': 0}
+        self._file = open(os.path.join(self.shard_dir, f"{name}.rec.tmp"), 'wb')
+        self._offsets = array('Q')
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+
+        name = self._current['name']
+        self._file.close()
+        os.replace(os.path.join(self.shard_dir, f"{name}.rec.tmp"),
+                   os.path.join(self.shard_dir, f"{name}.rec"))
+        atomic_write_bytes(os.path.join(self.shard_dir, f"{name}.idx"), self._offsets.tobytes())
+        self.manifest['shards'].append(self._current)
+        self._file = None
+
+
+class ShardReader:
+    def __init__(self, shard_dir, name):
+        self.path = os.path.join(shard_dir, f"{name}.rec")
+        self.offsets = array('Q')
+        with open(os.path.join(shard_dir, f"{name}.idx"), 'rb') as f:
+            self.offsets.frombytes(f.read())
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read(self, index, load_image=True):
+        with open(self.path, 'rb') as f:
+            return self._read_at(f, self.offsets[index], load_image)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def iter_records(self, load_image=True):
+        # One sequential pass over the shard file
+        with open(self.path, 'rb') as f:
+            for offset in self.offsets:
+                yield self._read_at(f, offset, load_image)
+
+    def _read_at(self, f, offset, load_image):
+        f.seek(offset)
+        header_length, image_length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        header = json.loads(f.read(header_length))
+        if load_image:
+            header['image'] = f.read(image_length)
+        return header
+
+
+def convert_to_shards(base_path, shard_dir, records_per_shard=4096, include_images=True):
+    # Packs samples added since the last conversion into new shards; existing shards are never rewritten.
+    # Returns the number of samples written.
+    metadata = MetadataStore(os.path.join(base_path, 'metadata.db'))
+    metadata.migrate_from_json(os.path.join(base_path, 'metadata.json'))
+    writer = ShardWriter(shard_dir, records_per_shard)
+
+    written = 0
+    for rowid, sample_id, info in metadata.find_after(writer.manifest['last_rowid']):
+        sample_dir = os.path.join(base_path, info['query_type'], sample_id)
+        try:
+            with open(os.path.join(sample_dir, 'analysis.json'), 'r') as f:
+                analysis = json.load(f)
+
+            image_bytes = b''
+            image_path = os.path.join(sample_dir, info.get('image_path', ''))
+            if include_images and os.path.isfile(image_path):
+                with open(image_path, 'rb') as f:
+                    image_bytes = f.read()
+        except Exception as e:
+            logger.warning(f"Skipping sample {sample_id}: {str(e)}")
+            continue
+
+        writer.write(rowid, {
+            'id': sample_id,
+            'rowid': rowid,
+            'type': info['query_type'],
+            'timestamp': info.get('timestamp'),
+            'image_path': info.get('image_path'),
+            'analysis': analysis
+        }, image_bytes)
+        written += 1
+
+    writer.close()
+    logger.info(f"Packed {written} samples into {shard_dir}")
+    return written
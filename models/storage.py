@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+def _tmp_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def atomic_write_bytes(path, data):
+    # Write to a temporary sibling and rename so readers never see a partial file
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, **kwargs):
+    atomic_write_bytes(path, json.dumps(data, **kwargs).encode('utf-8'))
+
+
+class BlobStore:
+    # Content-addressed image store: one file per unique SHA-256, sharded by prefix
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, digest, extension=''):
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}{extension}")
+
+    def put_bytes(self, data, extension=''):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write_bytes(path, data)
+        return digest, path
+
+    def put_file(self, source_path, extension=''):
+        hasher = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+
+        path = self.path_for(digest, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Share the source inode when possible instead of copying the bytes
+            tmp_path = _tmp_path(path)
+            try:
+                os.link(source_path, tmp_path)
+            except OSError:
+                shutil.copy2(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        return digest, path
+
+    def link(self, blob_path, dest_path):
+        # Hard link the blob into a sample directory, copying across filesystems
+        try:
+            os.link(blob_path, dest_path)
+        except OSError:
+            shutil.copy2(blob_path, dest_path)
+
+    def iter_blobs(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                yield os.path.join(dirpath, filename)
+
+    def gc(self, referenced, dry_run=False, min_age=3600):
+        # Remove blobs that no metadata row references and no other path links to.
+        # Files touched within min_age seconds are left alone so in-flight writes survive.
+        # Returns (removed_count, removed_bytes).
+        removed, removed_bytes = 0, 0
+        now = time.time()
+        for path in self.iter_blobs():
+            filename = os.path.basename(path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            if now - max(stat.st_mtime, stat.st_ctime) < min_age:
+                continue
+
+            if filename.endswith('.tmp'):
+                orphaned = True
+            else:
+                digest = filename.split('.', 1)[0]
+                orphaned = digest not in referenced and stat.st_nlink <= 1
+
+            if orphaned:
+                removed += 1
+                removed_bytes += stat.st_size
+                if not dry_run:
+                    os.remove(path)
+        return removed, removed_bytes
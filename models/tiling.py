@@ -0,0 +1,102 @@
+import difflib
+import os
+import re
+
+from PIL import Image
+
+# Tiled text extraction: 'auto' tiles page-like images (scans, documents) whose longest side
+# exceeds TEXT_TILE_MIN_SIDE, 'always' tiles everything larger than one tile, 'off' sends
+# the whole image in one call. Photos are never tiled in 'auto': each tile is a Gemini call.
+TEXT_TILING_MODES = ('auto', 'always', 'off')
+TEXT_TILING_MODE = os.getenv('TEXT_EXTRACTION_TILING', 'auto').lower()
+TEXT_TILE_MIN_SIDE = int(os.getenv('TEXT_TILE_MIN_SIDE', '2048'))
+TEXT_TILE_SIZE = int(os.getenv('TEXT_TILE_SIZE', '1024'))
+TEXT_TILE_OVERLAP = int(os.getenv('TEXT_TILE_OVERLAP', '128'))
+# Pages up to this width are cut into full-width strips so lines are never split sideways
+TEXT_TILE_MAX_WIDTH = int(os.getenv('TEXT_TILE_MAX_WIDTH', '3072'))
+TEXT_TILE_CONCURRENCY = int(os.getenv('TEXT_TILE_CONCURRENCY', '8'))
+# Longest side kept for text extraction when tiling is on, instead of the single-call size
+TEXT_TILED_MAX_SIDE = int(os.getenv('TEXT_TILED_MAX_SIDE', '6144'))
+
+if TEXT_TILING_MODE not in TEXT_TILING_MODES:
+    raise ValueError(f"Invalid TEXT_EXTRACTION_TILING: {TEXT_TILING_MODE}")
+
+# A page is mostly light and nearly colourless: at least this fraction of bright pixels
+# (HSV value >= 180) and at most this mean saturation (0-255) on a small thumbnail
+PAGE_MIN_LIGHT_FRACTION = float(os.getenv('TEXT_PAGE_MIN_LIGHT_FRACTION', '0.6'))
+PAGE_MAX_SATURATION = float(os.getenv('TEXT_PAGE_MAX_SATURATION', '40'))
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def looks_like_page(image, min_light_fraction=PAGE_MIN_LIGHT_FRACTION, max_saturation=PAGE_MAX_SATURATION):
+    import numpy as np
+
+    thumbnail = image.resize((64, 64), Image.Resampling.BOX)
+    if thumbnail.mode != 'RGB':
+        thumbnail = thumbnail.convert('RGB')
+    hsv = np.asarray(thumbnail.convert('HSV'))
+    return bool(hsv[..., 1].mean() <= max_saturation and (hsv[..., 2] >= 180).mean() >= min_light_fraction)
+
+
+def should_tile(image, mode=TEXT_TILING_MODE, min_side=TEXT_TILE_MIN_SIDE, tile_size=TEXT_TILE_SIZE):
+    if mode == 'off':
+        return False
+    if mode == 'always':
+        return max(image.size) > tile_size
+    return max(image.size) > min_side and looks_like_page(image)
+
+
+def _spans(length, tile, overlap):
+    # Start/end pairs covering [0, length) with tiles of `tile` pixels overlapping by `overlap`
+    if length <= tile:
+        return [(0, length)]
+    step = max(1, tile - overlap)
+    starts = list(range(0, length - tile, step)) + [length - tile]
+    return [(start, start + tile) for start in starts]
+
+
+def make_tiles(size, tile_size=TEXT_TILE_SIZE, overlap=TEXT_TILE_OVERLAP, max_width=TEXT_TILE_MAX_WIDTH):
+    # Tile boxes (left, top, right, bottom) in reading order: rows top to bottom, then left to right
+    width, height = size
+    columns = [(0, width)] if width <= max_width else _spans(width, tile_size, overlap)
+    return [(left, top, right, bottom)
+            for top, bottom in _spans(height, tile_size, overlap)
+            for left, right in columns]
+
+
+def _normalize(line):
+    return WHITESPACE_PATTERN.sub(' ', line).strip().lower()
+
+
+def _is_duplicate(line, neighbour_lines):
+    # The same line read in two overlapping tiles, possibly cut short at a tile edge
+    for other in neighbour_lines:
+        if line == other or (len(line) >= 4 and line in other):
+            return True
+        matcher = difflib.SequenceMatcher(None, line, other)
+        if matcher.quick_ratio() >= 0.9 and matcher.ratio() >= 0.9:
+            return True
+    return False
+
+
+def merge_tile_lines(tiles, tile_lines, window=8):
+    # Drops lines repeated in the overlap with the tile above or to the left and returns
+    # [(line, tile index)] in reading order. Overlap with the tile above can only repeat
+    # its last lines as this tile's first ones, so only `window` lines at each end are compared.
+    normalized = [[_normalize(line) for line in lines] for lines in tile_lines]
+
+    merged = []
+    for index, (left, top, right, bottom) in enumerate(tiles):
+        above, beside = [], []
+        for other_index, (other_left, other_top, other_right, other_bottom) in enumerate(tiles[:index]):
+            if other_left < right and left < other_right and other_top < top < other_bottom:
+                above.extend(normalized[other_index][-window:])
+            elif other_top < bottom and top < other_bottom and other_left < left < other_right:
+                beside.extend(normalized[other_index])
+
+        for position, (line, line_normalized) in enumerate(zip(tile_lines[index], normalized[index])):
+            neighbours = above + beside if position < window else beside
+            if line_normalized and not _is_duplicate(line_normalized, neighbours):
+                merged.append((line.strip(), index))
+    return merged
@@ -1,32 +1,46 @@
+import io
 import os
 import json
+import random
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import numpy as np
 import torch
-from torch.utils.data import Dataset, DataLoader
+from PIL import Image
+from torch.utils.data import Dataset, IterableDataset, DataLoader, get_worker_info
 import logging
+from models.metadata_store import MetadataStore
+from models.shards import ShardReader, convert_to_shards, load_manifest
+from models.ids import new_id
+from models.storage import atomic_write_json
 
 logger = logging.getLogger(__name__)
 
 class CustomDataset(Dataset):
-    def __init__(self, data_path, transform=None):
+    def __init__(self, data_path, transform=None, sample_ids=None):
         self.data_path = data_path
         self.transform = transform
-        self.samples = self._load_samples()
+        self.samples = self._load_samples(sample_ids)
 
-    def _load_samples(self):
+    def _load_samples(self, sample_ids=None):
         samples = []
-        metadata_file = os.path.join(self.data_path, 'metadata.json')
-        
-        with open(metadata_file, 'r') as f:
-            metadata = json.load(f)
+        metadata = MetadataStore(os.path.join(self.data_path, 'metadata.db'))
+        metadata.migrate_from_json(os.path.join(self.data_path, 'metadata.json'))
+
+        for sample_id, info in metadata.find(status='collected'):  # Only use collected samples
+            samples.append({
+                'id': sample_id,
+                'path': os.path.join(self.data_path, info['query_type'], sample_id),
+                'type': info['query_type'],
+                'image': info.get('image_path')
+            })
 
-        for sample_id, info in metadata.items():
-            if info['status'] == 'collected':  # Only use collected samples
-                samples.append({
-                    'id': sample_id,
-                    'path': os.path.join(self.data_path, info['query_type'], sample_id),
-                    'type': info['query_type']
-                })
+        # Restrict to a fixed snapshot, keeping the snapshot's order
+        if sample_ids is not None:
+            by_id = {sample['id']: sample for sample in samples}
+            samples = [by_id[sample_id] for sample_id in sample_ids if sample_id in by_id]
 
         return samples
 
@@ -40,64 +54,293 @@ class CustomDataset(Dataset):
         with open(os.path.join(sample['path'], 'analysis.json'), 'r') as f:
             analysis = json.load(f)
 
-        return {
+        item = {
             'id': sample['id'],
             'analysis': analysis,
             'type': sample['type']
         }
+        if self.transform is not None:
+            item['image'] = self.transform(os.path.join(sample['path'], sample['image'] or ''))
+        return item
+
+class ImageTensorTransform:
+    # Turns an image path, raw bytes or PIL image into a uint8 CHW tensor of a fixed size.
+    # Unreadable images become None and are masked out by collate_samples.
+    def __init__(self, size=224):
+        self.size = size
+
+    def __call__(self, source):
+        try:
+            if isinstance(source, (bytes, bytearray)):
+                source = io.BytesIO(source)
+            image = source if isinstance(source, Image.Image) else Image.open(source)
+            image.draft('RGB', (self.size, self.size))
+            image = image.convert('RGB').resize((self.size, self.size), Image.Resampling.BILINEAR)
+        except Exception as e:
+            logger.warning(f"Could not load training image: {str(e)}")
+            return None
+        return torch.from_numpy(np.asarray(image, dtype=np.uint8).copy()).permute(2, 0, 1)
+
+class ShardedDataset(IterableDataset):
+    # Streams records from packed shards written by models.shards.convert_to_shards.
+    # Images are turned into tensors (ImageTensorTransform by default) so collate_samples can stack them.
+    def __init__(self, shard_dir, since_rowid=0, query_types=None, load_images=False, transform=None):
+        self.shard_dir = shard_dir
+        self.since_rowid = since_rowid
+        self.query_types = set(query_types) if query_types else None
+        self.load_images = load_images
+        self.transform = transform or (ImageTensorTransform() if load_images else None)
+
+        # Only shards holding samples newer than the watermark are opened
+        manifest = load_manifest(shard_dir)
+        self.shards = [shard for shard in manifest['shards'] if shard['last_rowid'] > since_rowid]
+        self.watermark = max([since_rowid] + [shard['last_rowid'] for shard in self.shards])
+
+    def __iter__(self):
+        # Shards are split round-robin across DataLoader workers
+        worker = get_worker_info()
+        shards = self.shards if worker is None else self.shards[worker.id::worker.num_workers]
+
+        for shard in shards:
+            reader = ShardReader(self.shard_dir, shard['name'])
+            for record in reader.iter_records(load_image=self.load_images):
+                if record['rowid'] <= self.since_rowid:
+                    continue
+                if self.query_types and record['type'] not in self.query_types:
+                    continue
+
+                sample = {
+                    'id': record['id'],
+                    'analysis': record['analysis'],
+                    'type': record['type']
+                }
+                if self.load_images:
+                    sample['image'] = self.transform(record['image'])
+                yield sample
+
+def collate_samples(batch):
+    # Column-oriented batch: images are stacked into one (B, C, H, W) tensor with a
+    # validity mask, while analysis dicts (which differ in shape) stay a list
+    collated = {
+        'ids': [sample['id'] for sample in batch],
+        'types': [sample['type'] for sample in batch],
+        'analysis': [sample['analysis'] for sample in batch]
+    }
+
+    if batch and 'image' in batch[0]:
+        images = [sample['image'] for sample in batch]
+        reference = next((image for image in images if image is not None), None)
+        if reference is not None:
+            blank = torch.zeros_like(reference)
+            collated['images'] = torch.stack([blank if image is None else image for image in images])
+            collated['image_mask'] = torch.tensor([image is not None for image in images])
+
+    return collated
+
+def select_batch(batch, indices):
+    selected = {key: [value[index] for index in indices] for key, value in batch.items()
+                if isinstance(value, list)}
+    for key in ('images', 'image_mask'):
+        if key in batch:
+            selected[key] = batch[key][indices]
+    return selected
+
+def _train_partition_worker(base_path, batch_size, image_size, snapshot, partition, sample_ids,
+                            num_threads, num_workers):
+    # Entry point for one per-query-type training process
+    torch.set_num_threads(num_threads)
+    trainer = ModelTrainer(base_path, batch_size=batch_size, image_size=image_size,
+                           num_workers=num_workers)
+    trainer._train_partition(snapshot, partition, sample_ids)
+    return partition
 
 class ModelTrainer:
-    def __init__(self, base_path='static/training_data'):
+    # With shard_dir set, training streams packed shards and only sees samples added since
+    # the previous run; otherwise it reads the per-sample directories from a snapshot
+    def __init__(self, base_path='static/training_data', batch_size=32, image_size=224, num_workers=0,
+                 shard_dir=None):
         self.base_path = base_path
-        self.dataset = CustomDataset(base_path)
+        self.batch_size = batch_size
+        self.image_size = image_size
+        self.num_workers = num_workers
+        self.shard_dir = shard_dir
+        self.checkpoint_dir = os.path.join(base_path, 'checkpoints')
+        self.dataset = None
 
-    def train(self):
+    def train(self, parallel=False):
         logger.info("Starting model training...")
-        
+
+        if self.shard_dir:
+            self._train_from_shards()
+            return
+
+        try:
+            # Snapshot the samples for this run, or pick up an interrupted one
+            snapshot = self._load_snapshot()
+            if snapshot is None:
+                snapshot = self._create_snapshot(parallel)
+            else:
+                logger.info(f"Resuming training run {snapshot['run_id']}")
+
+            if snapshot.get('parallel'):
+                self._train_parallel(snapshot)
+            else:
+                self._train_partition(snapshot, 'all', snapshot['sample_ids'])
+
+            logger.info("Training completed successfully")
+            self._update_training_status(snapshot['sample_ids'])
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+        except Exception as e:
+            logger.error(f"Error during training: {str(e)}")
+            raise
+
+    def _train_from_shards(self):
+        # Packs new samples, then trains on everything past the stored watermark. The
+        # watermark only moves once a run completes, so an interrupted run is redone whole.
         try:
-            # Load the dataset
-            dataloader = DataLoader(self.dataset, batch_size=32, shuffle=True)
+            convert_to_shards(self.base_path, self.shard_dir, include_images=bool(self.image_size))
+            since_rowid = self._load_watermark()
+            transform = ImageTensorTransform(self.image_size) if self.image_size else None
+            self.dataset = ShardedDataset(self.shard_dir, since_rowid=since_rowid,
+                                          load_images=transform is not None, transform=transform)
+            dataloader = DataLoader(self.dataset, batch_size=self.batch_size, collate_fn=collate_samples,
+                                    num_workers=self.num_workers, persistent_workers=False)
 
-            # Training logic for each model type
+            sample_ids = []
             for batch in dataloader:
                 self._train_batch(batch)
+                sample_ids.extend(batch['ids'])
 
-            logger.info("Training completed successfully")
-            self._update_training_status()
+            self._update_training_status(sample_ids)
+            self._save_watermark(self.dataset.watermark)
+            logger.info(f"Training completed successfully on {len(sample_ids)} new samples "
+                        f"(rowid {since_rowid} to {self.dataset.watermark})")
 
         except Exception as e:
             logger.error(f"Error during training: {str(e)}")
             raise
 
+    def _load_watermark(self):
+        try:
+            with open(os.path.join(self.shard_dir, 'trainer_state.json'), 'r') as f:
+                return json.load(f)['since_rowid']
+        except FileNotFoundError:
+            return 0
+
+    def _save_watermark(self, rowid):
+        atomic_write_json(os.path.join(self.shard_dir, 'trainer_state.json'), {
+            'since_rowid': rowid,
+            'updated_at': datetime.now().isoformat()
+        })
+
+    def _train_partition(self, snapshot, partition, sample_ids):
+        completed = self._load_progress(snapshot['run_id'], partition)
+        batch_size = snapshot['batch_size']
+
+        # Load the dataset, skipping batches finished before an interruption
+        transform = ImageTensorTransform(self.image_size) if self.image_size else None
+        self.dataset = CustomDataset(self.base_path, transform=transform,
+                                     sample_ids=sample_ids[completed * batch_size:])
+        dataloader = DataLoader(self.dataset, batch_size=batch_size, shuffle=False,
+                                collate_fn=collate_samples, num_workers=self.num_workers,
+                                persistent_workers=False)
+
+        # Training logic for each model type
+        for batch in dataloader:
+            self._train_batch(batch)
+            completed += 1
+            self._save_progress(snapshot['run_id'], partition, completed)
+
+    def _train_parallel(self, snapshot):
+        # One process per query type; CPU cores are shared out between them
+        partitions = {}
+        for sample in CustomDataset(self.base_path, sample_ids=snapshot['sample_ids']).samples:
+            partitions.setdefault(sample['type'], []).append(sample['id'])
+        if not partitions:
+            return
+
+        cpu_count = os.cpu_count() or 1
+        cores_per_partition = max(1, cpu_count // len(partitions))
+        num_workers = self.num_workers or min(4, cores_per_partition // 2)
+        num_threads = max(1, cores_per_partition - num_workers)
+        logger.info(f"Training {len(partitions)} query types in parallel with "
+                    f"{num_threads} threads and {num_workers} loader workers each")
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=len(partitions), mp_context=context) as executor:
+            futures = [
+                executor.submit(_train_partition_worker, self.base_path, snapshot['batch_size'],
+                                self.image_size, snapshot, query_type, sample_ids,
+                                num_threads, num_workers)
+                for query_type, sample_ids in partitions.items()
+            ]
+            for future in futures:
+                logger.info(f"Finished training partition {future.result()}")
+
+    def _create_snapshot(self, parallel=False):
+        sample_ids = [sample['id'] for sample in CustomDataset(self.base_path).samples]
+        # Shuffle once up front so a resumed run sees the same order
+        random.shuffle(sample_ids)
+
+        snapshot = {
+            'run_id': new_id(),
+            'started_at': datetime.now().isoformat(),
+            'batch_size': self.batch_size,
+            'parallel': parallel,
+            'sample_ids': sample_ids
+        }
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        atomic_write_json(os.path.join(self.checkpoint_dir, 'snapshot.json'), snapshot)
+        logger.info(f"Training run {snapshot['run_id']} covers {len(sample_ids)} samples")
+        return snapshot
+
+    def _load_snapshot(self):
+        try:
+            with open(os.path.join(self.checkpoint_dir, 'snapshot.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _load_progress(self, run_id, partition):
+        try:
+            with open(os.path.join(self.checkpoint_dir, f'progress-{partition}.json'), 'r') as f:
+                progress = json.load(f)
+        except FileNotFoundError:
+            return 0
+        return progress['completed_batches'] if progress['run_id'] == run_id else 0
+
+    def _save_progress(self, run_id, partition, completed_batches):
+        atomic_write_json(os.path.join(self.checkpoint_dir, f'progress-{partition}.json'), {
+            'run_id': run_id,
+            'completed_batches': completed_batches,
+            'updated_at': datetime.now().isoformat()
+        })
+
     def _train_batch(self, batch):
-        for sample in batch:
-            query_type = sample['type']
-            
+        # Split the batch by query type and hand each task its own sub-batch
+        for query_type in dict.fromkeys(batch['types']):
+            indices = [index for index, sample_type in enumerate(batch['types']) if sample_type == query_type]
+            task_batch = batch if len(indices) == len(batch['types']) else select_batch(batch, indices)
+
             if query_type == 'classification':
-                self._train_classification(sample)
+                self._train_classification(task_batch)
             elif query_type == 'object_detection':
-                self._train_object_detection(sample)
+                self._train_object_detection(task_batch)
             # Add other training types as needed
 
-    def _update_training_status(self):
-        metadata_file = os.path.join(self.base_path, 'metadata.json')
-        with open(metadata_file, 'r') as f:
-            metadata = json.load(f)
-
-        # Update status of processed samples
-        for sample_id in metadata:
-            if metadata[sample_id]['status'] == 'collected':
-                metadata[sample_id]['status'] = 'trained'
-                metadata[sample_id]['trained_at'] = datetime.now().isoformat()
+    def _update_training_status(self, sample_ids):
+        metadata = MetadataStore(os.path.join(self.base_path, 'metadata.db'))
 
-        with open(metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=4)
+        # Update status of the samples in this run only; later arrivals stay 'collected'
+        metadata.update_status('trained', trained_at=datetime.now().isoformat(),
+                               sample_ids=sample_ids, from_status='collected')
 
     # Add specific training methods for each model type
-    def _train_classification(self, sample):
+    def _train_classification(self, batch):
         # Implement classification model training
         pass
 
-    def _train_object_detection(self, sample):
+    def _train_object_detection(self, batch):
         # Implement object detection model training
         pass 
\ No newline at end of file
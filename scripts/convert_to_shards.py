@@ -0,0 +1,20 @@
+import argparse
+import logging
+from models.shards import convert_to_shards
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack new training samples into shard files")
+    parser.add_argument('--base-path', default='static/training_data')
+    parser.add_argument('--shard-dir', default='static/training_data/shards')
+    parser.add_argument('--records-per-shard', type=int, default=4096)
+    parser.add_argument('--no-images', action='store_true', help="Only pack the analysis records")
+    args = parser.parse_args()
+
+    convert_to_shards(args.base_path, args.shard_dir, args.records_per_shard,
+                      include_images=not args.no_images)
+
+if __name__ == "__main__":
+    main()
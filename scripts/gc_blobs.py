@@ -0,0 +1,22 @@
+import argparse
+import logging
+from models.data_collector import DataCollector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove training-data blobs no sample refers to")
+    parser.add_argument('--base-path', default='static/training_data')
+    parser.add_argument('--min-age', type=int, default=3600,
+                        help="Skip blobs modified within this many seconds")
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    collector = DataCollector(args.base_path)
+    removed, removed_bytes = collector.gc_blobs(dry_run=args.dry_run, min_age=args.min_age)
+    action = "Would remove" if args.dry_run else "Removed"
+    logger.info(f"{action} {removed} orphaned blobs ({removed_bytes / (1024 * 1024):.1f} MiB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import argparse
+import logging
+import os
+from models.metadata_store import MetadataStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import metadata.json into the SQLite metadata store")
+    parser.add_argument('--base-path', default='static/training_data')
+    args = parser.parse_args()
+
+    store = MetadataStore(os.path.join(args.base_path, 'metadata.db'))
+    migrated = store.migrate_from_json(os.path.join(args.base_path, 'metadata.json'))
+    logger.info(f"Migrated {migrated} samples, store now holds {store.count()} samples")
+
+if __name__ == "__main__":
+    main()
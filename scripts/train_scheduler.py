@@ -1,3 +1,4 @@
+import os
 import schedule
 import time
 from models.trainer import ModelTrainer
@@ -6,10 +7,15 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Train each query type in its own process on multi-core hosts
+TRAIN_PARALLEL = os.getenv('TRAIN_PARALLEL', 'false').lower() in ('1', 'true', 'yes')
+# Train from packed shards, only on samples added since the last run (TRAIN_PARALLEL does not apply)
+TRAIN_SHARD_DIR = os.getenv('TRAIN_SHARD_DIR')
+
 def train_models():
     try:
-        trainer = ModelTrainer()
-        trainer.train()
+        trainer = ModelTrainer(shard_dir=TRAIN_SHARD_DIR)
+        trainer.train(parallel=TRAIN_PARALLEL)
         logger.info("Scheduled training completed successfully")
     except Exception as e:
         logger.error(f"Error in scheduled training: {str(e)}")
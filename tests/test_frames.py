@@ -0,0 +1,57 @@
+from PIL import Image
+
+from models.frames import aggregate_results, select_keyframes
+
+
+def test_aggregate_keeps_dict_items_once():
+    first = {'extracted_text': {
+        'printed_text': 'OPEN\nWelcome',
+        'handwritten_text': '',
+        'text_regions': [{'text': 'OPEN', 'box': [0, 0, 10, 5]}]
+    }}
+    second = {'extracted_text': {
+        'printed_text': 'Welcome\nClosed Sundays',
+        'handwritten_text': '',
+        'text_regions': [{'box': [0, 0, 10, 5], 'text': 'OPEN'}, {'text': 'Closed Sundays', 'box': [0, 9, 10, 14]}]
+    }}
+
+    result = aggregate_results([first, second])['extracted_text']
+
+    assert result['printed_text'] == 'OPEN\nWelcome\nClosed Sundays'
+    assert result['text_regions'] == [
+        {'text': 'OPEN', 'box': [0, 0, 10, 5]},
+        {'text': 'Closed Sundays', 'box': [0, 9, 10, 14]}
+    ]
+
+
+def test_aggregate_lists_and_single_values():
+    frames = [
+        {'classification': {'predictions': {'primary_subject': ['cat'], 'label': 'POSITIVE'}}},
+        {'classification': {'predictions': {'primary_subject': ['cat', 'sofa'], 'label': 'NEUTRAL'}}},
+        {'classification': {'predictions': {'primary_subject': ['dog'], 'label': 'NEUTRAL'}}},
+    ]
+
+    predictions = aggregate_results(frames)['classification']['predictions']
+
+    assert predictions['primary_subject'] == ['cat', 'sofa', 'dog']
+    assert predictions['label'] == 'NEUTRAL'
+
+
+def test_select_keyframes_keeps_scene_changes():
+    colours = ['red'] * 4 + ['blue'] * 4 + ['green'] * 4
+    frames = ((index, index * 100, Image.new('RGB', (64, 48), colour)) for index, colour in enumerate(colours))
+
+    keyframes, scanned = select_keyframes(frames, threshold=0.25, max_keyframes=8)
+
+    assert scanned == 12
+    assert [(index, timestamp) for index, timestamp, _ in keyframes] == [(0, 0), (4, 400), (8, 800)]
+
+
+def test_select_keyframes_drops_weakest_change_past_the_cap():
+    colours = ['black', (120, 120, 120), 'white']
+    frames = ((index, 0, Image.new('RGB', (64, 48), colour)) for index, colour in enumerate(colours))
+
+    keyframes, _ = select_keyframes(frames, threshold=0.1, max_keyframes=2)
+
+    assert [index for index, _, _ in keyframes][0] == 0
+    assert len(keyframes) == 2
@@ -0,0 +1,97 @@
+import pytest
+
+from benchmarks import fake_gemini
+from models.parsing import (
+    parse_classification_response,
+    parse_object_detection_response,
+    parse_sentiment_response
+)
+
+
+def test_classification_recorded_response():
+    result = parse_classification_response(fake_gemini.CLASSIFICATION_RESPONSE)
+
+    assert result['primary_subject'] == [
+        'A tabby cat sitting on a windowsill',
+        'Category: domestic animal / pet photography'
+    ]
+    assert result['scene_classification'] == [
+        'Indoor, residential living room',
+        'Daytime, soft natural light from the window',
+        'Indoor'
+    ]
+    assert result['style_composition'][0] == 'Candid photographic style'
+    assert len(result['technical_details']) == 2
+    assert result['additional_categories'] == ['Pets, animals, lifestyle', 'cat, window, cozy, home']
+
+
+def test_object_detection_recorded_response():
+    result = parse_object_detection_response(fake_gemini.OBJECT_DETECTION_RESPONSE)
+
+    assert result['main_objects'] == ['Cat', 'Windowsill', 'Potted plant']
+    assert result['background'] == ['Curtains', 'Blurred street outside the window']
+    assert result['relationships'] == 'The cat sits to the left of the potted plant on the windowsill'
+    assert result['distinctive_features'] == ['Strong backlight creating a rim light around the cat']
+
+
+def test_sentiment_recorded_response():
+    result = parse_sentiment_response(fake_gemini.SENTIMENT_RESPONSE)
+
+    assert result['overall_sentiment'] == {
+        'primary_emotion': 'POSITIVE',
+        'intensity': 'moderate',
+        'confidence': '100%'
+    }
+    assert result['emotional_components'] == ['Contentment', 'Comfort', 'Curiosity']
+    assert result['semantic_insights'] == ['Home as a place of rest', 'Companionship']
+
+
+@pytest.mark.parametrize('lines, expected', [
+    # POSITIVE beats NEGATIVE within one item
+    (['- Primary emotion: Positive, with no negative undertones'], 'POSITIVE'),
+    (['- Negative, though not without positive moments'], 'POSITIVE'),
+    (['- Mood: NEGATIVE'], 'NEGATIVE'),
+    # Across items the last one mentioning a label wins
+    (['- POSITIVE', '- Overall it reads as negative'], 'NEGATIVE'),
+    (['- NEGATIVE', '- Neutral framing', '- Positive resolution'], 'POSITIVE'),
+    (['- NEUTRAL'], 'NEUTRAL'),
+    ([], 'NEUTRAL'),
+])
+def test_sentiment_primary_emotion(lines, expected):
+    text = '\n'.join(['OVERALL SENTIMENT:'] + lines + ['', 'EMOTIONAL COMPONENTS:', '- Calm'])
+    assert parse_sentiment_response(text)['overall_sentiment']['primary_emotion'] == expected
+
+
+def test_sentiment_intensity():
+    text = 'OVERALL SENTIMENT:\n- POSITIVE\n- Emotional Intensity: high\n'
+    assert parse_sentiment_response(text)['overall_sentiment']['intensity'] == 'high'
+
+
+def test_header_layouts():
+    # Markdown, numbering, inline content and missing blank lines all parse the same way
+    text = '\n'.join([
+        '## 1) Main Objects: Cat',
+        '* Plant',
+        '**BACKGROUND**',
+        '- Curtains',
+        '3. Details:',
+        '- Green eyes',
+        'RELATIONSHIPS:',
+        'Cat left of plant',
+        'Plant right of cat',
+    ])
+    result = parse_object_detection_response(text)
+
+    assert result['main_objects'] == ['Cat', 'Plant']
+    assert result['background'] == ['Curtains']
+    assert result['details'] == ['Green eyes']
+    assert result['relationships'] == 'Cat left of plant\nPlant right of cat'
+    assert result['distinctive_features'] == []
+
+
+def test_header_words_inside_items_are_not_headers():
+    text = 'MAIN OBJECTS:\n- Background figure\n- Details of the frame\n'
+    result = parse_object_detection_response(text)
+
+    assert result['main_objects'] == ['Background figure', 'Details of the frame']
+    assert result['background'] == []
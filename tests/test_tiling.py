@@ -0,0 +1,113 @@
+from PIL import Image, ImageDraw
+
+from models.tiling import _spans, looks_like_page, make_tiles, merge_tile_lines, should_tile
+
+
+def test_spans_cover_length_with_overlap():
+    assert _spans(500, 1024, 128) == [(0, 500)]
+    assert _spans(1024, 1024, 128) == [(0, 1024)]
+
+    spans = _spans(3000, 1024, 128)
+    assert spans[0][0] == 0
+    assert spans[-1][1] == 3000
+    assert all(end - start == 1024 for start, end in spans)
+    # Neighbours overlap by at least the requested amount
+    assert all(previous[1] - current[0] >= 128 for previous, current in zip(spans, spans[1:]))
+
+
+def test_make_tiles_strips_for_narrow_pages():
+    tiles = make_tiles((2500, 4000), tile_size=1024, overlap=128, max_width=3072)
+
+    assert all(left == 0 and right == 2500 for left, _, right, _ in tiles)
+    assert [top for _, top, _, _ in tiles] == sorted(top for _, top, _, _ in tiles)
+    assert tiles[-1][3] == 4000
+
+
+def test_make_tiles_grid_for_wide_pages_in_reading_order():
+    tiles = make_tiles((4000, 2000), tile_size=1024, overlap=128, max_width=3072)
+
+    columns = len(_spans(4000, 1024, 128))
+    rows = len(_spans(2000, 1024, 128))
+    assert len(tiles) == rows * columns
+    # Row by row, left to right
+    assert tiles == sorted(tiles, key=lambda box: (box[1], box[0]))
+    assert max(right for _, _, right, _ in tiles) == 4000
+    assert max(bottom for _, _, _, bottom in tiles) == 2000
+
+
+def test_merge_drops_lines_repeated_in_vertical_overlap():
+    tiles = [(0, 0, 1000, 1024), (0, 896, 1000, 1920)]
+    tile_lines = [
+        ['Invoice 1042', 'Total due: 12.00', 'Thank you'],
+        ['Thank you', 'Page 1 of 2'],
+    ]
+
+    merged = merge_tile_lines(tiles, tile_lines)
+
+    assert [line for line, _ in merged] == ['Invoice 1042', 'Total due: 12.00', 'Thank you', 'Page 1 of 2']
+    assert [index for _, index in merged] == [0, 0, 0, 1]
+
+
+def test_merge_drops_lines_cut_at_the_tile_edge():
+    tiles = [(0, 0, 1000, 1024), (0, 896, 1000, 1920)]
+    tile_lines = [['Quarterly report'], ['Quarterly repor', 'Revenue grew']]
+
+    merged = merge_tile_lines(tiles, tile_lines)
+
+    assert [line for line, _ in merged] == ['Quarterly report', 'Revenue grew']
+
+
+def test_merge_keeps_repeats_outside_the_overlap_window():
+    # A line far down the next tile is new text, even when it matches the tile above
+    tiles = [(0, 0, 1000, 1024), (0, 896, 1000, 1920)]
+    tile_lines = [['Subtotal'], ['Item A', 'Item B', 'Subtotal']]
+
+    merged = merge_tile_lines(tiles, tile_lines, window=2)
+
+    assert [line for line, _ in merged] == ['Subtotal', 'Item A', 'Item B', 'Subtotal']
+
+
+def test_merge_drops_lines_repeated_in_horizontal_overlap():
+    tiles = [(0, 0, 1024, 1024), (896, 0, 1920, 1024)]
+    tile_lines = [['Left column', 'Shared caption'], ['Shared caption', 'Right column']]
+
+    merged = merge_tile_lines(tiles, tile_lines)
+
+    assert [line for line, _ in merged] == ['Left column', 'Shared caption', 'Right column']
+
+
+def test_merge_ignores_blank_lines_and_whitespace_differences():
+    tiles = [(0, 0, 1000, 1024), (0, 896, 1000, 1920)]
+    tile_lines = [['  Hello   world ', ''], ['hello world', 'Next']]
+
+    merged = merge_tile_lines(tiles, tile_lines)
+
+    assert [line for line, _ in merged] == ['Hello   world', 'Next']
+
+
+def _page(size):
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    for top in range(100, size[1] - 100, 60):
+        draw.rectangle([100, top, size[0] - 100, top + 12], fill='black')
+    return image
+
+
+def _photo(size):
+    return Image.effect_noise(size, 80).convert('RGB').point(lambda value: value // 2)
+
+
+def test_auto_mode_tiles_large_pages_only():
+    assert looks_like_page(_page((800, 1100)))
+    assert not looks_like_page(Image.new('RGB', (800, 600), (40, 120, 200)))
+
+    assert should_tile(_page((2480, 3508)), mode='auto', min_side=2048)
+    assert not should_tile(_page((1240, 1754)), mode='auto', min_side=2048)
+    assert not should_tile(_photo((4032, 3024)), mode='auto', min_side=2048)
+
+
+def test_explicit_modes():
+    photo = _photo((4032, 3024))
+    assert should_tile(photo, mode='always', tile_size=1024)
+    assert not should_tile(Image.new('RGB', (800, 600)), mode='always', tile_size=1024)
+    assert not should_tile(_page((2480, 3508)), mode='off')